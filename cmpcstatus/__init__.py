@@ -1,27 +1,34 @@
 import logging
-import sys
 
 from cmpcstatus.bot import Bot, BotHelpCommand, command_prefix
 from cmpcstatus.constants import INTENTS
+from cmpcstatus.logs import setup_logging
 
 log = logging.getLogger(__name__)
-log.addHandler(logging.StreamHandler(sys.stdout))
-log.setLevel(logging.INFO)
 
 
-def main():
+def create_bot(**kwargs) -> Bot:
     bot_instance = Bot(
         case_insensitive=True,
         command_prefix=command_prefix,
         intents=INTENTS,
         help_command=BotHelpCommand(),
+        **kwargs,
     )
+    return bot_instance
+
+
+def main():
+    listener = setup_logging()
+    bot_instance = create_bot()
 
     log.info("Connecting to discord...")
-    # remove fancy ass shell colour that looks dumb in dark theme
-    formatter = logging.Formatter(logging.BASIC_FORMAT)
     token = bot_instance.config.discord_token
-    bot_instance.run(token, log_formatter=formatter)
+    try:
+        # logging is already set up, keep discord.py from adding its own handler
+        bot_instance.run(token, log_handler=None)
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,402 @@
+"""Benchmarks on synthetic data, nothing here talks to discord.
+
+Usage:
+    python -m cmpcstatus.bench members [--members N] [--messages N]
+    python -m cmpcstatus.bench leaderboard [--rows N] [--seconds S]
+    python -m cmpcstatus.bench normalize [--messages N]
+    python -m cmpcstatus.bench prefix [--messages N]
+    python -m cmpcstatus.bench logs [--messages N] [--tasks N] [--write-delay S]
+
+`members` reports the RSS of a large guild under each member cache policy,
+each in a fresh process so the numbers don't mix.
+`leaderboard` reports calls/sec of the leaderboard queries on a database of
+synthetic swears, next to the separate total and per-key queries they replace.
+`normalize` runs a stream of chat-like messages, with punctuation, leet and
+zero-width characters mixed in, through the profanity verdict cache and
+reports its throughput and hit rate.
+`prefix` times command prefix matching over the same kind of messages with
+a few commands mixed in, against the linear scan it replaced.
+`logs` measures what a log call costs the event loop while many tasks log
+at once, for a plain stream handler and for the queue pipeline, written
+to a temporary file. --write-delay makes every write that much slower, like
+a busy terminal or console pipe.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+from cmpcstatus.bot import PrefixTable
+from cmpcstatus.classifiers import WordlistClassifier, read_words, wordlist_swears
+from cmpcstatus.cogs.profanity import VerdictCache, normalize_word
+from cmpcstatus.constants import COMMAND_PREFIX, INTENTS
+from cmpcstatus.database import connect
+from cmpcstatus.leaderboard import Leaderboard
+from cmpcstatus.logs import PLAIN_FORMATTER, setup_logging
+from cmpcstatus.members import MemberCache, member_cache_options
+
+
+async def calls_per_second(call: Callable[[], Awaitable], seconds: float) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        await call()
+        calls += 1
+    return calls / elapsed
+
+
+def rss_mb() -> float:
+    # peak resident set size, in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def member_data(member_id: int) -> dict:
+    return {
+        "user": {
+            "id": member_id,
+            "username": f"member{member_id}",
+            "discriminator": "0",
+            "global_name": None,
+            "avatar": None,
+        },
+        "roles": [],
+        "joined_at": "2021-06-05T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "nick": None,
+        "flags": 0,
+    }
+
+
+async def members_policy(policy: str, n_members: int, n_messages: int):
+    client = discord.Client(intents=INTENTS, **member_cache_options(policy))
+    state = client._connection
+    guild = discord.Guild(
+        data={"id": 1, "name": "synthetic", "member_count": n_members}, state=state
+    )
+    state._add_guild(guild)
+    cache = MemberCache()
+    before = rss_mb()
+
+    if policy == "all":
+        # what chunking at startup does
+        for member_id in range(1, n_members + 1):
+            guild._add_member(
+                discord.Member(data=member_data(member_id), guild=guild, state=state)
+            )
+    else:
+        # a few members say most things
+        rng = random.Random(0)
+        for _ in range(n_messages):
+            member_id = min(int(rng.paretovariate(0.5)), n_members)
+            member = discord.Member(
+                data=member_data(member_id), guild=guild, state=state
+            )
+            cache.seen(member)
+
+    kept = len(guild._members) + sum(m is not None for m in cache.members.values())
+    print(f"{policy}: {kept} members kept, {before:.0f} MB -> {rss_mb():.0f} MB")
+
+
+def members(args):
+    if args.policy is not None:
+        asyncio.run(members_policy(args.policy, args.members, args.messages))
+        return
+    print(f"{args.members} members, {args.messages} messages")
+    for policy in ("all", "recent"):
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "cmpcstatus.bench",
+                "members",
+                f"--policy={policy}",
+                f"--members={args.members}",
+                f"--messages={args.messages}",
+            ],
+            check=True,
+        )
+
+
+async def fill_lb(conn, n_rows: int, n_authors: int, n_words: int):
+    rng = random.Random(0)
+    authors = [rng.paretovariate(1.2) for _ in range(n_authors)]
+    words = [rng.paretovariate(1.0) for _ in range(n_words)]
+    for start in range(0, n_rows, 100_000):
+        count = min(100_000, n_rows - start)
+        author_ids = rng.choices(range(n_authors), weights=authors, k=count)
+        word_ids = rng.choices(range(n_words), weights=words, k=count)
+        await conn.executemany(
+            "INSERT INTO lb VALUES (?, ?, ?, ?, 0, 1)",
+            (
+                (start + i, float(start + i), author_ids[i], f"swear{word_ids[i]}")
+                for i in range(count)
+            ),
+        )
+    await conn.commit()
+    await conn.execute("ANALYZE")
+
+
+async def leaderboard_bench(n_rows: int, seconds: float):
+    n_authors, n_words = 5_000, 700
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = await connect(str(Path(tmp) / "db.sqlite3"))
+        print(f"Filling {n_rows:,} rows...")
+        await fill_lb(conn, n_rows, n_authors, n_words)
+        lb = Leaderboard(conn)
+        rng = random.Random(1)
+        many = list(range(0, n_authors, n_authors // 100))
+
+        async def count(where: str, arg: dict) -> int:
+            query = f"SELECT COUNT(*) FROM lb WHERE guild_id=1 {where}"
+            async with conn.execute_fetchall(query, arg) as rows:
+                return rows[0][0]
+
+        async def separate_total():
+            author_id = rng.randrange(n_authors)
+            await lb.top(1, "word", 10, author_id=author_id)
+            await count("AND author_id=:author_id", {"author_id": author_id})
+
+        async def separate_counts():
+            for author_id in many:
+                await count("AND author_id=:author_id", {"author_id": author_id})
+
+        benchmarks = {
+            "top words of the guild": lambda: lb.top(1, "word", 10),
+            "top words of an author": lambda: lb.top(
+                1, "word", 10, author_id=rng.randrange(n_authors)
+            ),
+            "  same, total in a separate query": separate_total,
+            "top authors of a word": lambda: lb.top(
+                1, "author_id", 10, word=f"swear{rng.randrange(n_words)}"
+            ),
+            f"totals of {len(many)} authors": lambda: lb.totals(1, "author_id", many),
+            f"  same, {len(many)} separate queries": separate_counts,
+        }
+        for name, call in benchmarks.items():
+            rate = await calls_per_second(call, seconds)
+            print(f"{name}: {rate:,.0f} calls/s")
+        await conn.close()
+
+
+def leaderboard(args):
+    asyncio.run(leaderboard_bench(args.rows, args.seconds))
+
+
+def token_variants(word: str, swear: bool) -> list[str]:
+    variants = [word, word.capitalize(), f"{word}!", f"{word},", f"{word}..."]
+    if swear:
+        leet = word.replace("i", "1").replace("s", "$").replace("o", "0")
+        variants += [leet, word.upper(), f"{word[:1]}\u200b{word[1:]}"]
+    return variants
+
+
+def chat_messages(n_messages: int) -> list[list[str]]:
+    rng = random.Random(0)
+    swears = wordlist_swears()
+    tokens = []
+    for word in read_words():
+        tokens += token_variants(word, swear=False)
+    for word in swears:
+        tokens += token_variants(word, swear=True)
+    rng.shuffle(tokens)
+    # a few tokens make up most of chat
+    cum_weights = list(itertools.accumulate(1 / (r + 1) for r in range(len(tokens))))
+    return [
+        rng.choices(tokens, cum_weights=cum_weights, k=rng.randint(1, 15))
+        for _ in range(n_messages)
+    ]
+
+
+def normalize(args):
+    messages = chat_messages(args.messages)
+    tokens = [t for m in messages for t in m]
+    print(f"{len(messages):,} messages, {len(tokens):,} tokens")
+    print(f"{len(set(tokens)):,} different tokens")
+
+    start = time.perf_counter()
+    for t in tokens:
+        normalize_word(t)
+    elapsed = time.perf_counter() - start
+    print(f"normalize_word alone: {len(tokens) / elapsed:,.0f} tokens/s")
+
+    classifier = WordlistClassifier()
+    sample = tokens[:2_000]
+    start = time.perf_counter()
+    for t in sample:
+        classifier.predict([normalize_word(t)])
+    elapsed = time.perf_counter() - start
+    print(f"no cache, one token at a time: {len(sample) / elapsed:,.0f} tokens/s")
+
+    verdicts = VerdictCache()
+    verdicts.set_classifier(classifier)
+    start = time.perf_counter()
+    for m in messages:
+        verdicts.classify(m)
+    elapsed = time.perf_counter() - start
+    rate = verdicts.hits / (verdicts.hits + verdicts.misses)
+    print(f"verdict cache: {len(tokens) / elapsed:,.0f} tokens/s, {rate:.1%} hits")
+
+
+def scan_prefixes(content: str) -> Optional[str]:
+    # how prefixes were matched before PrefixTable
+    prefix_lengths = {p: len(p) for p in COMMAND_PREFIX}
+    longest = max(prefix_lengths.values())
+    message_start = content[:longest]
+    possible = message_start.casefold()
+    for prefix, length in prefix_lengths.items():
+        if possible.startswith(prefix):
+            return message_start[:length]
+    return None
+
+
+def prefix(args):
+    rng = random.Random(0)
+    commands = [
+        "random word",
+        "Random game",
+        "c.lb",
+        "cmpc.leaderblame fuck",
+        "$ping",
+        "c.quintslb 5",
+    ]
+    contents = []
+    for m in chat_messages(args.messages):
+        if rng.random() < args.commands:
+            contents.append(rng.choice(commands))
+        elif rng.random() < 0.02:
+            contents.append(f"<@329885271787307008> {' '.join(m)}")
+        else:
+            contents.append(" ".join(m))
+    table = PrefixTable(COMMAND_PREFIX)
+    assert [table.match(c) for c in contents] == [scan_prefixes(c) for c in contents]
+    matched = sum(table.match(c) is not None for c in contents)
+    print(f"{len(contents):,} messages, {matched:,} commands")
+
+    for name, match in (("linear scan", scan_prefixes), ("prefix table", table.match)):
+        start = time.perf_counter()
+        for c in contents:
+            match(c)
+        elapsed = time.perf_counter() - start
+        ns = elapsed / len(contents) * 1e9
+        print(f"{name}: {len(contents) / elapsed:,.0f} messages/s, {ns:.0f} ns each")
+
+
+async def log_from_tasks(n_messages: int, n_tasks: int) -> float:
+    """Log n_messages from n_tasks tasks, return the seconds spent logging."""
+    per_task = n_messages // n_tasks
+    spent = [0.0]
+
+    async def worker(i: int):
+        log = logging.getLogger(f"cmpcstatus.bench.{i % 10}")
+        hot = logging.getLogger("discord.gateway")
+        for n in range(per_task):
+            start = time.perf_counter()
+            log.info("message %d from task %d", n, i, extra={"guild_id": 1})
+            hot.info("heartbeat %d", n)
+            spent[0] += time.perf_counter() - start
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(i) for i in range(n_tasks)))
+    return spent[0]
+
+
+class SlowFile:
+    def __init__(self, file, delay: float):
+        self.file = file
+        self.delay = delay
+
+    def write(self, s: str):
+        time.sleep(self.delay)
+        return self.file.write(s)
+
+    def flush(self):
+        self.file.flush()
+
+
+def logs(args):
+    root = logging.getLogger()
+    old_handlers, old_level, old_stdout = root.handlers[:], root.level, sys.stdout
+    calls = args.messages // args.tasks * args.tasks * 2
+    try:
+        for name in ("stream handler", "queue, plain", "queue, json"):
+            with tempfile.TemporaryFile("w") as file:
+                output = SlowFile(file, args.write_delay) if args.write_delay else file
+                start = time.perf_counter()
+                if name == "stream handler":
+                    # how logging was set up before the queue
+                    for h in root.handlers[:]:
+                        root.removeHandler(h)
+                    handler = logging.StreamHandler(output)
+                    handler.setFormatter(PLAIN_FORMATTER)
+                    root.addHandler(handler)
+                    root.setLevel(logging.INFO)
+                    listener = None
+                else:
+                    sys.stdout = output
+                    listener = setup_logging(json=name.endswith("json"))
+                spent = asyncio.run(log_from_tasks(args.messages, args.tasks))
+                if listener is not None:
+                    listener.stop()
+                elapsed = time.perf_counter() - start
+                sys.stdout = old_stdout
+            print(
+                f"{name}: {spent / calls * 1e6:.1f} µs per call on the loop,"
+                f" {calls / elapsed:,.0f} calls/s written"
+            )
+    finally:
+        sys.stdout = old_stdout
+        for h in root.handlers[:]:
+            root.removeHandler(h)
+        for h in old_handlers:
+            root.addHandler(h)
+        root.setLevel(old_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m cmpcstatus.bench")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = benchmarks.add_parser("members", help="RSS of each member cache policy")
+    p.add_argument("--members", type=int, default=200_000)
+    p.add_argument("--messages", type=int, default=100_000)
+    p.add_argument("--policy", choices=("all", "recent"), help=argparse.SUPPRESS)
+    p.set_defaults(run=members)
+
+    p = benchmarks.add_parser("leaderboard", help="leaderboard queries per second")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--seconds", type=float, default=2.0)
+    p.set_defaults(run=leaderboard)
+
+    p = benchmarks.add_parser("normalize", help="profanity verdict cache throughput")
+    p.add_argument("--messages", type=int, default=100_000)
+    p.set_defaults(run=normalize)
+
+    p = benchmarks.add_parser("prefix", help="command prefix matching speed")
+    p.add_argument("--messages", type=int, default=200_000)
+    p.add_argument("--commands", type=float, default=0.05, help="share of commands")
+    p.set_defaults(run=prefix)
+
+    p = benchmarks.add_parser("logs", help="log overhead per message")
+    p.add_argument("--messages", type=int, default=100_000)
+    p.add_argument("--tasks", type=int, default=100)
+    p.add_argument("--write-delay", type=float, default=0.0)
+    p.set_defaults(run=logs)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,30 @@
+import asyncio
+import dataclasses
 import datetime
+import hashlib
+import importlib
+import json
 import logging
 import platform
+import signal
+import sys
 import tomllib
-from dataclasses import dataclass
+from collections import Counter
+from dataclasses import dataclass, field
 from io import BytesIO
 from typing import Optional
 
 import aiohttp
+import aiosqlite
 import discord
-from discord import Embed, Member, Message, utils
+from discord import Embed, Member, Message, RawMemberRemoveEvent, utils
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
 from PIL import Image, ImageDraw, ImageFont
 
-from cmpcstatus.cogs import ProfanityLeaderboard, Quints
+from cmpcstatus.cogs import ProfanityLeaderboard, Quints, WordStats
 from cmpcstatus.cogs.commands import BasicCommands, DeveloperCommands
-from cmpcstatus.cogs.events import FishGamingWednesday, MarcelGamingBirthday
+from cmpcstatus.cogs.events import EventEngine
 from cmpcstatus.constants import (
     CLOCK_TIMES,
     COLOUR_GREEN,
@@ -23,27 +32,88 @@ from cmpcstatus.constants import (
     COMMAND_PREFIX,
     EMOJI_SAT_CAT,
     EMOJI_SKULL,
-    ENABLE_BIRTHDAY,
     ENABLE_CLOCK,
-    ENABLE_FISH,
+    ENABLE_EVENTS,
     ENABLE_PROFANITY,
     ENABLE_READY_MESSAGE,
     ENABLE_SLASH_COMMANDS,
+    ENABLE_WATCHDOG,
     ENABLE_WELCOME,
+    ENABLE_WORDS,
     FONT_SIZE_WELCOME,
     GUILD_EGGYBOI,
     PATH_CONFIG,
+    RATE_LIMITS,
     ROLE_MEMBER,
+    SHUTDOWN_TIMEOUT,
     TESTING,
     TEXT_CHANNEL_BOT_COMMANDS,
     TEXT_CHANNEL_GENERAL,
     TZ_AMSTERDAM,
     VOICE_CHANNEL_CLOCK,
 )
+from cmpcstatus.database import connect, get_state, set_state
+from cmpcstatus.members import MemberCache, MemberCachePolicy, member_cache_options
+from cmpcstatus.ratelimit import RateLimiter
+from cmpcstatus.uploads import UploadCache
 from cmpcstatus.util import get_asset
+from cmpcstatus.watchdog import LoopWatchdog
 
 log = logging.getLogger(__name__)
 
+# names discord.py gives the tasks running event handlers and app commands
+HANDLER_TASK_PREFIXES = ("discord.py: ", "CommandTree-invoker")
+# dispatched by the bot itself from work that shutdown waits for
+INTERNAL_EVENTS = frozenset({"message_words"})
+
+
+@dataclass
+class GuildConfig:
+    guild_id: int
+    role_member: Optional[int] = None
+    text_channel_general: Optional[int] = None
+    text_channel_bot_commands: Optional[int] = None
+    voice_channel_clock: Optional[int] = None
+    # replaces COMMAND_PREFIX in this guild
+    command_prefix: Optional[list[str]] = None
+
+
+class PrefixTable:
+    """Command prefixes grouped by first character, matched ignoring case.
+
+    Most messages aren't commands and are turned away after looking up
+    their first character.
+    """
+
+    def __init__(self, prefixes: list[str]):
+        self.by_first: dict[str, list[str]] = {}
+        # longest first, so "cmpc." wins over "c."
+        for p in sorted((p.casefold() for p in prefixes), key=len, reverse=True):
+            self.by_first.setdefault(p[0], []).append(p)
+
+    def match(self, content: str) -> Optional[str]:
+        """Return the prefix as written in content, if content starts with one."""
+        if not content:
+            return None
+        candidates = self.by_first.get(content[0].casefold())
+        if candidates is None:
+            return None
+        for prefix in candidates:
+            start = content[: len(prefix)]
+            if start.casefold() == prefix:
+                return start
+        return None
+
+
+# used when config.toml has no [guilds] table
+DEFAULT_GUILD = GuildConfig(
+    guild_id=GUILD_EGGYBOI,
+    role_member=ROLE_MEMBER,
+    text_channel_general=TEXT_CHANNEL_GENERAL,
+    text_channel_bot_commands=TEXT_CHANNEL_BOT_COMMANDS,
+    voice_channel_clock=VOICE_CHANNEL_CLOCK,
+)
+
 
 @dataclass
 class BotConfig:
@@ -52,52 +122,202 @@ class BotConfig:
     ptero_address: str
     ptero_server_id: str
     ptero_token: str
+    # None lets discord pick the number of shards
+    shard_count: Optional[int] = None
+    # processes to split the shards over, see cmpcstatus.launcher
+    clusters: int = 1
+    member_cache: MemberCachePolicy = "all"
+    # classifier name and options, see cmpcstatus.classifiers
+    profanity: dict = field(default_factory=dict)
+    guilds: dict[int, GuildConfig] = field(default_factory=dict)
 
 
 def load_config(fp: str = PATH_CONFIG) -> BotConfig:
     with open(fp, "rb") as file:
         t = tomllib.load(file)
 
+    guilds = {
+        int(guild_id): GuildConfig(guild_id=int(guild_id), **g)
+        for guild_id, g in t.get("guilds", {}).items()
+    }
+    if not guilds:
+        guilds = {DEFAULT_GUILD.guild_id: DEFAULT_GUILD}
+
     config = BotConfig(
         discord_token=t["discord_token"],
         tenor_token=t["tenor_token"],
         ptero_address=t["ptero_address"],
         ptero_server_id=t["ptero_server_id"],
         ptero_token=t["ptero_token"],
+        shard_count=t.get("shard_count"),
+        clusters=t.get("clusters", 1),
+        member_cache=t.get("member_cache", "all"),
+        profanity=t.get("profanity", {}),
+        guilds=guilds,
     )
 
     return config
 
 
-class Bot(commands.Bot):
+class Bot(commands.AutoShardedBot):
     def __init__(self, *args, **kwargs):
         self.config = load_config()
         self.session: Optional[aiohttp.ClientSession] = None
+        self.db: Optional[aiosqlite.Connection] = None
+        self.uploads: Optional[UploadCache] = None
+        self.watchdog: Optional[LoopWatchdog] = None
+        kwargs.setdefault("shard_count", self.config.shard_count)
+        for k, v in member_cache_options(self.config.member_cache).items():
+            kwargs.setdefault(k, v)
+        self.member_cache = MemberCache()
+        # sent with every identify, so it survives reconnects without an update
+        kwargs.setdefault(
+            "activity",
+            discord.Activity(
+                type=discord.ActivityType.watching, name="the cmpc discord"
+            ),
+        )
+        self.ready_once = False
+        self.closing = False
+        self.closing_task: Optional[asyncio.Task] = None
+        # tasks waiting in close(), draining mustn't wait for them in turn
+        self.closers: set[asyncio.Task] = set()
+        self.closers_changed: Optional[asyncio.Future] = None
+        self.dropped_events: Counter[str] = Counter()
+        self.rate_limiter = RateLimiter(RATE_LIMITS)
+        self.default_prefixes = PrefixTable(COMMAND_PREFIX)
+        self.guild_prefixes: dict[int, PrefixTable] = {}
         super().__init__(*args, **kwargs)
 
+    def guild_config(self, guild_id: Optional[int]) -> Optional[GuildConfig]:
+        return self.config.guilds.get(guild_id)
+
+    def get_guild_channel(self, guild_id: Optional[int], attr: str):
+        """Get a configured channel of a guild, e.g. attr="text_channel_general"."""
+        config = self.guild_config(guild_id)
+        if config is None:
+            return None
+        channel_id = getattr(config, attr)
+        if channel_id is None:
+            return None
+        return self.get_channel(channel_id)
+
     async def setup_hook(self):
+        # the launcher and service managers stop the bot with SIGTERM
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, lambda: asyncio.create_task(self.close())
+            )
+        except NotImplementedError:
+            # windows
+            pass
+        if ENABLE_WATCHDOG:
+            self.watchdog = LoopWatchdog()
+            self.watchdog.start()
         # set up http session
         self.session = aiohttp.ClientSession()
+        # shared database connection
+        self.db = await connect()
+        self.uploads = UploadCache(self, self.db)
+        await self.uploads.setup()
+
+        # once per invocation, so the help command doesn't use up tokens
+        self.add_check(self.rate_limiter.check, call_once=True)
 
         # add default cogs
         await self.add_cog(BasicCommands(self))
         await self.add_cog(DeveloperCommands(self))
-        if ENABLE_BIRTHDAY:
-            await self.add_cog(MarcelGamingBirthday(self))
-        if ENABLE_FISH:
-            await self.add_cog(FishGamingWednesday(self))
+        if ENABLE_EVENTS:
+            await self.add_cog(EventEngine(self))
         if ENABLE_PROFANITY:
             await self.add_cog(ProfanityLeaderboard(self))
-        await self.add_cog(Quints())
+            if ENABLE_WORDS:
+                await self.add_cog(WordStats(self))
+        await self.add_cog(Quints(self))
 
         print("done")  # this line is needed to work with ptero
 
+    def reload_config(self):
+        """Re-read config.toml into the existing BotConfig."""
+        config = load_config()
+        if config.shard_count != self.config.shard_count:
+            log.warning("Changing shard_count needs a restart")
+        for f in dataclasses.fields(config):
+            setattr(self.config, f.name, getattr(config, f.name))
+        self.guild_prefixes.clear()
+
+    def prefix_table(self, guild_id: Optional[int]) -> PrefixTable:
+        table = self.guild_prefixes.get(guild_id)
+        if table is not None:
+            return table
+        config = self.guild_config(guild_id)
+        if config is None or config.command_prefix is None:
+            table = self.default_prefixes
+        else:
+            table = PrefixTable(config.command_prefix)
+        if guild_id is not None:
+            self.guild_prefixes[guild_id] = table
+        return table
+
+    async def reload_cogs(self, name: str) -> list[str]:
+        """Reload a module under cmpcstatus.cogs and replace the cogs it defines.
+
+        Submodules are reloaded first. Return the names of replaced cogs.
+        """
+        package = "cmpcstatus.cogs"
+        if name != package and not name.startswith(f"{package}."):
+            name = f"{package}.{name}"
+        modules = [m for m in sys.modules if m == name or m.startswith(f"{name}.")]
+        if not modules:
+            raise commands.ExtensionNotFound(name)
+        modules.sort(key=lambda m: m.count("."), reverse=True)
+
+        replaced = []
+        for module_name in modules:
+            module = importlib.reload(sys.modules[module_name])
+            for obj in vars(module).values():
+                if not (
+                    isinstance(obj, type)
+                    and issubclass(obj, commands.Cog)
+                    and obj.__module__ == module.__name__
+                ):
+                    continue
+                old = self.get_cog(obj.__cog_name__)
+                if old is None:
+                    continue
+                await self.remove_cog(old.qualified_name)
+                await self.add_cog(obj(self))
+                replaced.append(obj.__cog_name__)
+        return replaced
+
     async def send_ready_message(self, message: str):
-        if ENABLE_READY_MESSAGE:
-            ready_channel = self.get_channel(TEXT_CHANNEL_BOT_COMMANDS)
-            await ready_channel.send(message)
+        if not ENABLE_READY_MESSAGE:
+            return
+        for guild_id in self.config.guilds:
+            channel = self.get_guild_channel(guild_id, "text_channel_bot_commands")
+            if channel is not None:
+                await channel.send(message)
+
+    async def sync_tree(self, guild: Optional[discord.abc.Snowflake] = None):
+        """Upload slash commands, unless they match the last upload."""
+        tree_commands = self.tree.get_commands(guild=guild)
+        payload = json.dumps([c.to_dict() for c in tree_commands], sort_keys=True)
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        key = f"tree:{self.application_id}:{guild.id if guild else 'global'}"
+        if await get_state(self.db, key) == digest:
+            log.info("Slash commands unchanged (%s)", key)
+            return
+        await self.tree.sync(guild=guild)
+        await set_state(self.db, key, digest)
+        log.info("Synced slash commands (%s)", key)
 
     async def on_ready(self):
+        # on_ready fires again after every reconnect that can't resume
+        if self.ready_once:
+            log.info("Reconnected to discord as: %s", self.user)
+            return
+        self.ready_once = True
+
         # start task loops
         if ENABLE_CLOCK:
             if not self.clock.is_running():
@@ -106,32 +326,101 @@ class Bot(commands.Bot):
 
         # upload slash commands
         if ENABLE_SLASH_COMMANDS:
-            await self.tree.sync()
+            await self.sync_tree()
             if TESTING:
                 server = self.get_guild(GUILD_EGGYBOI)
                 self.tree.copy_global_to(guild=server)
-                await self.tree.sync(guild=server)
-
-        # set activity
-        await self.change_presence(
-            activity=discord.Activity(
-                type=discord.ActivityType.watching, name="the cmpc discord"
-            )
-        )
+                await self.sync_tree(guild=server)
 
-        log.info(f"Connected to discord as: %s", self.user)
+        log.info("Connected to discord as: %s", self.user)
         await self.send_ready_message(f"Connected from `{platform.node()}`")
 
+    def dispatch(self, event_name: str, /, *args, **kwargs):
+        # nothing new is started once shutting down
+        if self.closing and event_name not in INTERNAL_EVENTS:
+            self.dropped_events[event_name] += 1
+            return
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def drain(self, timeout: float) -> list[str]:
+        """Wait for running event handlers, including ones they start.
+
+        Handlers still running after timeout are cancelled, their names
+        are returned.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        current = asyncio.current_task()
+        while True:
+            tasks = {
+                t
+                for t in asyncio.all_tasks()
+                if t is not current
+                and t not in self.closers
+                and t.get_name().startswith(HANDLER_TASK_PREFIXES)
+            }
+            if not tasks:
+                return []
+            # a handler calling close() now waits on us, stop waiting on it
+            self.closers_changed = loop.create_future()
+            done, pending = await asyncio.wait(
+                {*tasks, self.closers_changed},
+                timeout=deadline - loop.time(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                pending.discard(self.closers_changed)
+                for t in pending:
+                    t.cancel()
+                await asyncio.wait(pending)
+                return [t.get_name() for t in pending]
+
     async def close(self):
+        """Shut down in order, without losing work that is already running.
+
+        New events are dropped, running handlers get SHUTDOWN_TIMEOUT seconds
+        to finish, cogs flush their buffers as they are unloaded, and only
+        then are the gateway, the http session and the database closed.
+
+        Closing again, e.g. from a signal during shutdown, waits for the
+        first close to finish.
+        """
+        current = asyncio.current_task()
+        self.closers.add(current)
+        if self.closers_changed is not None and not self.closers_changed.done():
+            self.closers_changed.set_result(None)
+        if self.closing_task is None:
+            self.closing = True
+            self.closing_task = asyncio.create_task(self.shut_down(), name="close")
+        try:
+            # cancelling one caller doesn't stop the shutdown
+            await asyncio.shield(self.closing_task)
+        finally:
+            self.closers.discard(current)
+
+    async def shut_down(self):
         log.info("Closing bot instance")
-        await self.send_ready_message(f"Disconnecting from `{platform.node()}`")
-
-        await self.session.close()
         if self.clock.is_running():
             self.clock.stop()
-        await super().close()
 
-        log.info("Closed gracefully")
+        cancelled = await self.drain(SHUTDOWN_TIMEOUT)
+        if cancelled:
+            log.warning("Cancelled %d event handlers: %s", len(cancelled), cancelled)
+        await self.send_ready_message(f"Disconnecting from `{platform.node()}`")
+
+        # unloads the cogs, then closes the gateway and discord's http client
+        await super().close()
+        if self.session is not None:
+            await self.session.close()
+        if self.db is not None:
+            await self.db.close()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+        log.info(
+            "Closed gracefully, dropped events: %s",
+            dict(self.dropped_events) or "none",
+        )
 
     async def on_command_error(
         self, ctx: Context, exception: commands.errors.CommandError
@@ -140,15 +429,20 @@ class Bot(commands.Bot):
         await ctx.send(str(exception))
 
     async def on_member_join(self, member: Member):
-        role = utils.get(member.guild.roles, id=ROLE_MEMBER)
-        await member.add_roles(role)
+        self.member_cache.seen(member)
+        config = self.guild_config(member.guild.id)
+        if config is None:
+            return
+        if config.role_member is not None:
+            role = utils.get(member.guild.roles, id=config.role_member)
+            await member.add_roles(role)
 
-        if not ENABLE_WELCOME:
+        channel = self.get_guild_channel(member.guild.id, "text_channel_general")
+        if not ENABLE_WELCOME or channel is None:
             return
         name = member.name
         log.info("%s joined", name)
 
-        channel = self.get_channel(TEXT_CHANNEL_GENERAL)
         async with channel.typing():
             # create image
             newline = "\n" if len(name) > 10 else " "
@@ -184,15 +478,24 @@ class Bot(commands.Bot):
             embed.set_image(url=f"attachment://{filename}")
             await channel.send(content=member.mention, file=file, embed=embed)
 
-    async def on_member_remove(self, member: Member):
-        log.info("%s left", member.name)
-        channel = self.get_channel(TEXT_CHANNEL_GENERAL)
+    async def on_raw_member_remove(self, payload: RawMemberRemoveEvent):
+        # on_member_remove only fires for cached members, which with the
+        # "recent" policy are almost none
+        user = payload.user
+        self.member_cache.left(payload.guild_id, user.id)
+        log.info("%s left", user.name)
+        channel = self.get_guild_channel(payload.guild_id, "text_channel_general")
+        if channel is None:
+            return
         message = await channel.send(
-            f"{EMOJI_SAT_CAT} *** {member.name} *** left the eggyboi family {EMOJI_SAT_CAT}"
+            f"{EMOJI_SAT_CAT} *** {user.name} *** left the eggyboi family {EMOJI_SAT_CAT}"
         )
         await message.add_reaction(EMOJI_SKULL)
 
     async def on_message(self, message: Message):
+        # discord.py doesn't keep these when the member cache is off
+        if self.config.member_cache == "recent" and isinstance(message.author, Member):
+            self.member_cache.seen(message.author)
         await super().on_message(message)
 
         t = message.content.casefold()
@@ -208,19 +511,20 @@ class Bot(commands.Bot):
     async def clock(self):
         datetime_amsterdam = datetime.datetime.now(TZ_AMSTERDAM)
         ams_time = datetime_amsterdam.strftime("cmpc: %H:%M")
-        log.debug(f"time for cmpc: %s", ams_time)
-        channel = self.get_channel(VOICE_CHANNEL_CLOCK)
-        await channel.edit(name=ams_time)
+        log.debug("time for cmpc: %s", ams_time)
+        for guild_id in self.config.guilds:
+            channel = self.get_guild_channel(guild_id, "voice_channel_clock")
+            # on_ready runs this straight away to catch up after a restart,
+            # which usually finds the name already right
+            if channel is not None and channel.name != ams_time:
+                await channel.edit(name=ams_time)
 
 
 def command_prefix(bot: Bot, message: Message) -> list[str]:
-    prefix_lengths = {p: len(p) for p in COMMAND_PREFIX}
-    longest = max(prefix_lengths.values())
-    message_start = message.content[:longest]
-    possible = message_start.casefold()
-    for prefix, length in prefix_lengths.items():
-        if possible.startswith(prefix):
-            return [message_start[:length]]
+    guild_id = message.guild.id if message.guild is not None else None
+    prefix = bot.prefix_table(guild_id).match(message.content)
+    if prefix is not None:
+        return [prefix]
     return commands.when_mentioned(bot, message)
 
 
@@ -0,0 +1,242 @@
+"""Profanity classifiers, picked by name from the [profanity] table of config.toml.
+
+Usage:
+    python -m cmpcstatus.classifiers train MODEL
+    python -m cmpcstatus.classifiers compare MODEL [--words FILE]
+
+`train` fits the linear backend on the wordlist (swears) and words.txt
+(everything else), except for one in PROFANITY_MODEL_HOLDOUT words which
+are held out. `compare` measures throughput of both backends and how often
+they agree, on the held out words or on the words in FILE.
+"""
+
+import argparse
+import time
+import zlib
+from typing import Callable, Mapping, Optional, Sequence
+
+from cmpcstatus.constants import (
+    PATH_PROFANITY_MODEL,
+    PROFANITY_MODEL_FEATURES,
+    PROFANITY_MODEL_HOLDOUT,
+    PROFANITY_MODEL_NGRAMS,
+)
+from cmpcstatus.util import get_asset
+
+# only the linear backend needs numpy
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ProfanityClassifier:
+    """Decides which normalized words are swears, a batch at a time."""
+
+    name: str
+
+    def predict(self, words: Sequence[str]) -> list[bool]:
+        raise NotImplementedError
+
+
+CLASSIFIERS: dict[str, type[ProfanityClassifier]] = {}
+
+
+def register(cls: type[ProfanityClassifier]) -> type[ProfanityClassifier]:
+    CLASSIFIERS[cls.name] = cls
+    return cls
+
+
+def get_classifier(options: Mapping) -> ProfanityClassifier:
+    """Build the backend named by options["classifier"] from the rest of options."""
+    options = dict(options)
+    name = options.pop("classifier", "wordlist")
+    try:
+        cls = CLASSIFIERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown profanity classifier: {name}") from None
+    return cls(**options)
+
+
+@register
+class WordlistClassifier(ProfanityClassifier):
+    """better_profanity's word list, one word at a time."""
+
+    name = "wordlist"
+
+    def __init__(self):
+        from better_profanity import profanity
+
+        self.profanity = profanity
+        profanity.load_censor_words()
+
+    def predict(self, words: Sequence[str]) -> list[bool]:
+        return [self.profanity.contains_profanity(w) for w in words]
+
+
+def hash_ngrams(
+    word: str, n_features: int, ngrams: tuple[int, int]
+) -> tuple[list[int], list[float]]:
+    """Feature indices and signs of the character n-grams of a word.
+
+    The sign comes from a separate bit of the hash so collisions tend to
+    cancel out instead of adding up.
+    """
+    word = f"<{word}>"
+    indices = []
+    signs = []
+    low, high = ngrams
+    for n in range(low, high + 1):
+        for i in range(len(word) - n + 1):
+            h = zlib.crc32(word[i : i + n].encode())
+            indices.append(h % n_features)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+    return indices, signs
+
+
+def vectorize(words: Sequence[str], n_features: int, ngrams: tuple[int, int]):
+    """A sparse matrix as (row, column, value) arrays, one row per word."""
+    rows, cols, vals = [], [], []
+    for row, word in enumerate(words):
+        indices, signs = hash_ngrams(word, n_features, ngrams)
+        rows.extend([row] * len(indices))
+        cols.extend(indices)
+        vals.extend(signs)
+    return (
+        np.array(rows, dtype=np.intp),
+        np.array(cols, dtype=np.intp),
+        np.array(vals, dtype=np.float64),
+    )
+
+
+@register
+class LinearClassifier(ProfanityClassifier):
+    """A logistic regression over hashed character n-grams, CPU only.
+
+    Words are hashed in python, the scoring of the whole batch is one numpy
+    gather and one bincount.
+    """
+
+    name = "linear"
+
+    def __init__(self, model: str = PATH_PROFANITY_MODEL):
+        if np is None:
+            raise RuntimeError("the linear profanity classifier needs numpy")
+        with np.load(model) as data:
+            self.weights = data["weights"]
+            self.bias = float(data["bias"])
+            self.ngrams = tuple(int(n) for n in data["ngrams"])
+        self.n_features = len(self.weights)
+
+    def scores(self, words: Sequence[str]):
+        rows, cols, vals = vectorize(words, self.n_features, self.ngrams)
+        dot = np.bincount(rows, weights=self.weights[cols] * vals, minlength=len(words))
+        return dot + self.bias
+
+    def predict(self, words: Sequence[str]) -> list[bool]:
+        if not words:
+            return []
+        return (self.scores(words) > 0).tolist()
+
+
+def train_linear(
+    words: Sequence[str],
+    labels: Sequence[bool],
+    path: str,
+    n_features: int = PROFANITY_MODEL_FEATURES,
+    ngrams: tuple[int, int] = PROFANITY_MODEL_NGRAMS,
+    epochs: int = 300,
+    rate: float = 0.5,
+):
+    """Fit the linear backend with full batch gradient descent and save it."""
+    rows, cols, vals = vectorize(words, n_features, ngrams)
+    y = np.array(labels, dtype=np.float64)
+    # swears are rare, weigh both classes equally
+    positive = max(y.sum(), 1)
+    sample_weight = np.where(y == 1, len(y) / (2 * positive), 1.0)
+    sample_weight /= sample_weight.sum()
+    weights = np.zeros(n_features)
+    bias = 0.0
+    for _ in range(epochs):
+        dot = np.bincount(rows, weights=weights[cols] * vals, minlength=len(y))
+        p = 1 / (1 + np.exp(-(dot + bias)))
+        error = (p - y) * sample_weight
+        weights -= rate * np.bincount(
+            cols, weights=error[rows] * vals, minlength=n_features
+        )
+        bias -= rate * error.sum()
+    np.savez_compressed(path, weights=weights, bias=bias, ngrams=np.array(ngrams))
+
+
+def read_words(path: Optional[str] = None) -> list[str]:
+    if path is None:
+        with get_asset("words.txt") as p:
+            path = str(p)
+    with open(path) as file:
+        return [w for w in file.read().split() if w]
+
+
+def wordlist_swears() -> list[str]:
+    from better_profanity import profanity
+
+    profanity.load_censor_words()
+    return sorted({str(w) for w in profanity.CENSOR_WORDSET})
+
+
+def held_out(word: str) -> bool:
+    # by hash, so the split is the same for train and compare
+    return zlib.crc32(word.encode()) % PROFANITY_MODEL_HOLDOUT == 0
+
+
+def labelled_words(held: bool) -> tuple[list[str], list[bool]]:
+    """Swears and other words, either the held out ones or the rest."""
+    swears = wordlist_swears()
+    others = sorted(set(read_words()) - set(swears))
+    swears = [w for w in swears if held_out(w) == held]
+    others = [w for w in others if held_out(w) == held]
+    return swears + others, [True] * len(swears) + [False] * len(others)
+
+
+def benchmark(predict: Callable[[list[str]], list[bool]], words: list[str]):
+    start = time.perf_counter()
+    result = predict(words)
+    elapsed = time.perf_counter() - start
+    return result, len(words) / max(elapsed, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m cmpcstatus.classifiers")
+    parser.add_argument("action", choices=("train", "compare"))
+    parser.add_argument("model", nargs="?", default=PATH_PROFANITY_MODEL)
+    parser.add_argument(
+        "--words", help="words to compare on, defaults to the held out words"
+    )
+    args = parser.parse_args()
+
+    if args.action == "train":
+        words, labels = labelled_words(held=False)
+        train_linear(words, labels, args.model)
+        print(f"Trained on {sum(labels)} swears and {labels.count(False)} other words")
+        return
+
+    if args.words:
+        words, labels = read_words(args.words), None
+    else:
+        words, labels = labelled_words(held=True)
+    baseline, baseline_rate = benchmark(WordlistClassifier().predict, words)
+    linear, linear_rate = benchmark(LinearClassifier(args.model).predict, words)
+    agree = sum(a == b for a, b in zip(baseline, linear))
+    missed = sum(a and not b for a, b in zip(baseline, linear))
+    extra = sum(b and not a for a, b in zip(baseline, linear))
+    print(f"{len(words)} words")
+    print(f"wordlist: {baseline_rate:,.0f} words/s")
+    print(f"linear: {linear_rate:,.0f} words/s")
+    print(f"agreement {agree / len(words):.2%}, missed {missed}, extra {extra}")
+    if labels is not None:
+        # the wordlist knows its own swears, the linear model never saw these
+        correct = sum(p == y for p, y in zip(linear, labels))
+        print(f"linear accuracy on held out words {correct / len(words):.2%}")
+
+
+if __name__ == "__main__":
+    main()
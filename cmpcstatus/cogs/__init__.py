@@ -1,3 +1,4 @@
 from ._base import BotCog
 from .profanity import ProfanityLeaderboard
 from .quints_etc import Quints
+from .words import WordStats
@@ -1,22 +1,28 @@
+import asyncio
 import logging
 import random
-import subprocess
+import tempfile
 import urllib.parse
 from http import HTTPStatus
 from io import BytesIO
 from pathlib import Path
 from string import capwords
-from tempfile import TemporaryFile
-from typing import Optional
+from typing import BinaryIO, Optional
 
+import aiohttp
 import discord
 from discord import Embed
 from discord.ext import commands
 from discord.ext.commands import Context
 
 from cmpcstatus.cogs import BotCog
-from cmpcstatus.constants import COLOUR_RED
-from cmpcstatus.util import get_asset
+from cmpcstatus.constants import (
+    COLOUR_RED,
+    MENTION_NONE,
+    RANDOM_GAME_BUFFER,
+    RANDOM_GAME_TIMEOUT,
+)
+from cmpcstatus.util import get_asset, run_command
 
 log = logging.getLogger(__name__)
 
@@ -32,6 +38,50 @@ class BasicCommands(BotCog):
     with get_asset("animals.txt") as path:
         animals = read_lines(path)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # random games resolved ahead of time, topped up in the background
+        self.random_games: asyncio.Queue[str] = asyncio.Queue(RANDOM_GAME_BUFFER)
+        self.random_games_task: Optional[asyncio.Task] = None
+        # zip of the source at the last HEAD it was built for
+        self.source_path: Optional[Path] = None
+        self.source_lock = asyncio.Lock()
+
+    async def cog_load(self):
+        self.random_games_task = asyncio.create_task(self.fill_random_games())
+
+    async def cog_unload(self):
+        if self.random_games_task is not None:
+            self.random_games_task.cancel()
+
+    async def resolve_random_game(self) -> str:
+        # only the redirect is needed, not the store page it points to
+        async with self.bot.session.get(
+            "https://store.steampowered.com/explore/random/", allow_redirects=False
+        ) as response:
+            location = response.headers.get("Location")
+            if location is None:
+                response.raise_for_status()
+                raise ValueError(f"No redirect from {response.url}")
+        return location.removesuffix("?snr=1_239_random_")
+
+    async def fill_random_games(self):
+        backoff = 1
+        while True:
+            try:
+                url = await self.resolve_random_game()
+            except (aiohttp.ClientError, ValueError) as e:
+                log.warning("Could not get a random game: %s", e)
+            except Exception:
+                # anything else mustn't end the task and leave the buffer empty
+                log.exception("Could not get a random game")
+            else:
+                backoff = 1
+                await self.random_games.put(url)
+                continue
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
     @commands.hybrid_command(name="capybara", aliases=("capy",))
     async def random_capybara(self, ctx: Context):
         """gives you a random capybara"""
@@ -61,11 +111,13 @@ class BasicCommands(BotCog):
     @commands.hybrid_command(name="game")
     async def random_game(self, ctx: Context):
         """gives you a random game"""
-        async with ctx.bot.session.get(
-            "https://store.steampowered.com/explore/random/"
-        ) as response:
-            shorten = str(response.url).removesuffix("?snr=1_239_random_")
-        await ctx.send(shorten)
+        # waiting callers are served in order as the buffer refills
+        try:
+            url = await asyncio.wait_for(self.random_games.get(), RANDOM_GAME_TIMEOUT)
+        except asyncio.TimeoutError:
+            # steam is slow or the filler is backing off, try once directly
+            url = await self.resolve_random_game()
+        await ctx.send(url)
 
     @commands.hybrid_command(name="gif", aliases=("g",))
     async def random_gif(
@@ -104,9 +156,15 @@ class BasicCommands(BotCog):
         await ctx.send(f"{randomnumber}")
 
     @commands.hybrid_command(name="word")
-    async def random_word(self, ctx: Context):
-        """gives you a random word"""
-        return await ctx.send(random.choice(self.common_words))
+    async def random_word(self, ctx: Context, server: bool = False):
+        """gives you a random word, or one people here have said"""
+        word = None
+        words = self.bot.get_cog("WordStats")
+        if server and words is not None and ctx.guild is not None:
+            word = words.random_word(ctx.guild.id)
+        if word is None:
+            word = random.choice(self.common_words)
+        return await ctx.send(word, allowed_mentions=MENTION_NONE)
 
     @commands.command(hidden=True)
     async def testconn(self, ctx: Context):
@@ -124,13 +182,28 @@ class BasicCommands(BotCog):
 
         if upload:
             async with ctx.typing():
-                with TemporaryFile() as file:
-                    subprocess.run(
-                        ["git", "archive", "--format=zip", "HEAD"], stdout=file
-                    )
-                    file.seek(0)
-                    discord_file = discord.File(file, filename="source.zip")
-                    await message.reply(file=discord_file)
+                file = await self.source_archive()
+                discord_file = discord.File(file, filename="source.zip")
+                await message.reply(file=discord_file)
+
+    async def source_archive(self) -> BinaryIO:
+        """Zip of the checked out commit, only rebuilt when HEAD moves.
+
+        The zip is opened before the lock is released, so a call that
+        replaces it can't delete it from under an upload.
+        """
+        async with self.source_lock:
+            head = (await run_command("git", "rev-parse", "HEAD")).strip()
+            path = Path(tempfile.gettempdir(), f"cmpc-source-{head}.zip")
+            if path == self.source_path and path.exists():
+                return path.open("rb")
+            await run_command(
+                "git", "archive", "--format=zip", f"--output={path}", head
+            )
+            if self.source_path is not None:
+                self.source_path.unlink(missing_ok=True)
+            self.source_path = path
+            return path.open("rb")
 
     async def ping_url(self, url: str):
         async with self.bot.session.head(url) as r:
@@ -1,6 +1,6 @@
 import logging
-import subprocess
-import sys
+import time
+from pathlib import Path
 from typing import Literal, Optional
 
 import discord
@@ -9,8 +9,10 @@ from discord.ext import commands
 from discord.ext.commands import Context
 
 from cmpcstatus.cogs import BotCog
-from cmpcstatus.cogs.events import EventCog
+from cmpcstatus.cogs.events import EventEngine
 from cmpcstatus.constants import ROLE_DEVELOPER
+from cmpcstatus.scanner import HistoryScanner, ScanProgress
+from cmpcstatus.util import run_command
 
 log = logging.getLogger(__name__)
 
@@ -50,7 +52,7 @@ class DeveloperCommands(BotCog):
     @commands.command(hidden=True)
     async def exit(self, ctx: Context):
         await ctx.send("OK")
-        sys.exit()
+        await self.bot.close()
 
     @commands.command(hidden=True)
     async def test_event(
@@ -67,27 +69,89 @@ class DeveloperCommands(BotCog):
         member = member or ctx.author
         await events[event](member)
 
+    def get_events(self) -> EventEngine:
+        engine = self.bot.get_cog(EventEngine.__cog_name__)
+        if engine is None:
+            raise commands.BadArgument("Events are disabled")
+        return engine
+
     @commands.command(hidden=True)
     async def test_fish(
-        self, ctx: Context, event: Literal["start", "lock", "end"], name: str
+        self, ctx: Context, event: Literal["start", "lock", "end"], *, name: str
     ):
-        await ctx.send("Getting cog")
-        cog = self.bot.get_cog(name)
-        if cog is None:
-            raise ValueError(f"No cog with name: {name}")
-        if not isinstance(cog, EventCog):
-            raise TypeError(f"Not an event cog: {name}")
-        await ctx.send("Got cog")
-
-        events = {
-            "start": cog.event_start,
-            "lock": cog.event_lock,
-            "end": cog.event_end,
-        }
-        requested_event = events[event]
-        await requested_event()
+        engine = self.get_events()
+        definition = engine.events.get(name)
+        if definition is None:
+            raise ValueError(f"No event with name: {name}")
+        await engine.run_phase(definition, event)
         await ctx.send("Called event")
 
+    @commands.command(hidden=True)
+    async def reload_events(self, ctx: Context):
+        engine = self.get_events()
+        engine.load()
+        await ctx.send(f"Loaded {len(engine.events)} events")
+
+    @commands.command(hidden=True)
+    async def reload(self, ctx: Context, *modules: str):
+        """Reload config.toml and/or cog modules, e.g. reload config profanity"""
+        start = time.perf_counter()
+        done = []
+        for module in modules:
+            if module == "config":
+                self.bot.reload_config()
+                done.append("config")
+            else:
+                done.extend(await self.bot.reload_cogs(module))
+        elapsed = (time.perf_counter() - start) * 1000
+        await ctx.send(f"Reloaded {', '.join(done) or 'nothing'} in {elapsed:.0f} ms")
+
+    @commands.command(hidden=True)
+    async def rate_limits(self, ctx: Context):
+        limiter = self.bot.rate_limiter
+        lines = [
+            f"{name}: {limiter.allowed[name]} allowed, {limiter.rejected[name]} limited"
+            for name in limiter.limits
+        ]
+        lines.append(f"{len(limiter.buckets)} active buckets")
+        await ctx.send("\n".join(lines))
+
+    @commands.command(hidden=True)
+    async def scan_history(
+        self,
+        ctx: Context,
+        consumers: str,
+        limit: Optional[int],
+        around: Optional[discord.Message],
+        *channels: discord.TextChannel,
+    ):
+        """Read history once for several analyses, e.g. profanity,quints"""
+        available = {}
+        for cog in self.bot.cogs.values():
+            make = getattr(cog, "make_history_consumer", None)
+            if make is not None:
+                consumer = make()
+                available[consumer.name] = consumer
+        names = consumers.split(",")
+        missing = [n for n in names if n not in available]
+        if missing:
+            raise commands.BadArgument(
+                f"Unknown {', '.join(missing)}, pick from {', '.join(available)}"
+            )
+        selected = [available[n] for n in names]
+
+        status_message = await ctx.send("Scanning")
+
+        async def update_status(progress: ScanProgress):
+            summaries = "\n".join(f"{c.name}: {c.summary()}" for c in selected)
+            await status_message.edit(content=f"{progress}\n{summaries}")
+
+        scanner = HistoryScanner(selected, on_progress=update_status)
+        for c in channels:
+            await scanner.scan(c, limit=limit, around=around)
+        await scanner.finish()
+        await ctx.send("Done scanning")
+
     @commands.command(hidden=True)
     async def update_clock(self, ctx: Context):
         await self.bot.clock()
@@ -95,5 +159,40 @@ class DeveloperCommands(BotCog):
 
     @commands.command(hidden=True)
     async def git_last(self, ctx: Context):
-        stdout = subprocess.check_output(["git", "log", "--max-count=1"], text=True)
+        stdout = await run_command("git", "log", "--max-count=1")
         await ctx.send(f"```{stdout}```")
+
+    @commands.command(hidden=True, aliases=("lag",))
+    async def loop_lag(self, ctx: Context, rows: int = 5):
+        """Show what blocked the event loop the longest."""
+        watchdog = self.bot.watchdog
+        if watchdog is None:
+            raise commands.BadArgument("The watchdog is off, see ENABLE_WATCHDOG.")
+        cogs = {type(c).__qualname__: name for name, c in self.bot.cogs.items()}
+        callbacks = {
+            c.callback.__qualname__: c.qualified_name for c in self.bot.walk_commands()
+        }
+        lines = [
+            f"Loop lag: mean {watchdog.mean_lag * 1000:.1f} ms,"
+            f" max {watchdog.max_lag * 1000:.0f} ms over {watchdog.beats} beats"
+        ]
+        for o in watchdog.worst(rows):
+            cog = command = None
+            # outermost frames first, that's the handler or command
+            for _, _, qualname in o.stack:
+                cog = cog or cogs.get(qualname.split(".")[0])
+                command = command or callbacks.get(qualname)
+            ours = [f for f in o.stack if "cmpcstatus" in f[0]] or o.stack
+            if not ours:
+                continue
+            file, line, function = ours[-1]
+            leaf = o.stack[-1][2]
+            lines.append(
+                f"`{o.worst * 1000:.0f} ms` worst, {o.blocks}x,"
+                f" {o.total * 1000:.0f} ms total: {o.task}, cog {cog or '-'},"
+                f" command {command or '-'}, at {Path(file).name}:{line}"
+                f" {function} in {leaf}"
+            )
+        if len(lines) == 1:
+            lines.append("Nothing blocked it yet.")
+        await ctx.send("\n".join(lines)[:2000])
@@ -1,3 +1,2 @@
-from ._base import EventCog
-from .fgw import FishGamingWednesday
-from .mgb import MarcelGamingBirthday
+from ._definition import EventDefinition, load_events
+from .engine import EventEngine
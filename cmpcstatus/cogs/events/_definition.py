@@ -0,0 +1,194 @@
+import datetime
+import tomllib
+from dataclasses import dataclass
+from typing import Literal, Mapping, Optional
+
+from cmpcstatus.constants import (
+    CHANNEL_PERMISSIONS_HIDDEN,
+    CHANNEL_PERMISSIONS_LOCKED,
+    CHANNEL_PERMISSIONS_OPEN,
+    PATH_EVENTS,
+    TESTING,
+    TZ_AMSTERDAM,
+)
+from cmpcstatus.util import get_asset
+
+PhaseKind = Literal["start", "lock", "end"]
+
+PERMISSIONS = {
+    "open": CHANNEL_PERMISSIONS_OPEN,
+    "locked": CHANNEL_PERMISSIONS_LOCKED,
+    "hidden": CHANNEL_PERMISSIONS_HIDDEN,
+}
+
+# how far ahead to look for the next date of an event, a year and a leap day
+SCHEDULE_HORIZON_DAYS = 367
+
+
+@dataclass(frozen=True)
+class EventMessage:
+    content: str = ""
+    assets: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Phase:
+    kind: PhaseKind
+    days_after: int
+    time: datetime.time
+    permissions: Mapping[str, bool]
+
+
+@dataclass(frozen=True)
+class EventDefinition:
+    name: str
+    channel_id: int
+    channel_name: str
+    channel_topic: str
+    mention: str
+    start_messages: tuple[EventMessage, ...]
+    end_message: str
+    end_asset: str
+    phases: tuple[Phase, ...]
+    weekday: Optional[int] = None
+    month: Optional[int] = None
+    day: Optional[int] = None
+
+    def is_event_date(self, date: datetime.date) -> bool:
+        # testing runs every event every day
+        if TESTING:
+            return True
+        if self.weekday is not None:
+            return date.isoweekday() == self.weekday
+        return (date.month, date.day) == (self.month, self.day)
+
+    def phase_at(self, phase: Phase, date: datetime.date) -> datetime.datetime:
+        """When the phase runs for the event happening on date."""
+        date += datetime.timedelta(days=phase.days_after)
+        return datetime.datetime.combine(date, phase.time, tzinfo=TZ_AMSTERDAM)
+
+    def next_phase(
+        self, phase: Phase, after: datetime.datetime
+    ) -> Optional[datetime.datetime]:
+        """The first time after `after` that the phase runs."""
+        # the event may have started a few days before `after`
+        date = after.astimezone(TZ_AMSTERDAM).date()
+        date -= datetime.timedelta(days=phase.days_after)
+        for _ in range(SCHEDULE_HORIZON_DAYS):
+            if self.is_event_date(date):
+                when = self.phase_at(phase, date)
+                if when > after:
+                    return when
+            date += datetime.timedelta(days=1)
+        return None
+
+    def previous_phase(
+        self, phase: Phase, before: datetime.datetime
+    ) -> Optional[datetime.datetime]:
+        """The last time at or before `before` that the phase ran."""
+        date = before.astimezone(TZ_AMSTERDAM).date()
+        date -= datetime.timedelta(days=phase.days_after)
+        for _ in range(SCHEDULE_HORIZON_DAYS):
+            if self.is_event_date(date):
+                when = self.phase_at(phase, date)
+                if when <= before:
+                    return when
+            date -= datetime.timedelta(days=1)
+        return None
+
+    def get_phase(self, kind: PhaseKind) -> Optional[Phase]:
+        for p in self.phases:
+            if p.kind == kind:
+                return p
+        return None
+
+
+REQUIRED = object()
+
+
+def check(t: dict, key: str, kind: type, default=REQUIRED):
+    """t[key] if it has the right type, default if it's missing."""
+    if key not in t:
+        if default is REQUIRED:
+            raise KeyError(f"{t.get('name', 'event')}: missing {key}")
+        return default
+    value = t[key]
+    # bool is an int too
+    if not isinstance(value, kind) or isinstance(value, bool) and kind is not bool:
+        name = t.get("name", "event")
+        raise TypeError(f"{name}: {key} should be {kind.__name__}, not {value!r}")
+    return value
+
+
+def check_asset(name: str, asset):
+    if not isinstance(asset, str):
+        raise TypeError(f"{name}: asset should be str, not {asset!r}")
+    with get_asset(asset) as path:
+        if not path.is_file():
+            raise ValueError(f"{name}: asset {asset} doesn't exist")
+
+
+def parse_event(t: dict) -> EventDefinition:
+    """Build an event from its toml table, checking every field and asset."""
+    name = check(t, "name", str)
+    mention = check(t, "mention", str)
+    if TESTING:
+        mention = check(t, "mention_testing", str, mention)
+    start_messages = tuple(
+        EventMessage(
+            content=check(m, "content", str, "").format(mention=mention),
+            assets=tuple(check(m, "assets", list, [])),
+        )
+        for m in check(t, "start_messages", list, [])
+    )
+    phases = []
+    for p in check(t, "phases", list):
+        permissions = check(p, "permissions", str)
+        if permissions not in PERMISSIONS:
+            raise ValueError(f"{name}: unknown permissions {permissions!r}")
+        phases.append(
+            Phase(
+                kind=check(p, "kind", str),
+                days_after=check(p, "days_after", int, 0),
+                time=check(p, "time", datetime.time),
+                permissions=PERMISSIONS[permissions],
+            )
+        )
+    if "weekday" not in t and ("month" not in t or "day" not in t):
+        raise ValueError(f"{name}: needs a weekday or a month and day")
+
+    event = EventDefinition(
+        name=name,
+        channel_id=check(t, "channel", int),
+        channel_name=check(t, "channel_name", str),
+        channel_topic=check(t, "channel_topic", str),
+        mention=mention,
+        start_messages=start_messages,
+        end_message=check(t, "end_message", str),
+        end_asset=check(t, "end_asset", str),
+        phases=tuple(phases),
+        weekday=check(t, "weekday", int, None),
+        month=check(t, "month", int, None),
+        day=check(t, "day", int, None),
+    )
+    for p in event.phases:
+        if p.kind not in ("start", "lock", "end"):
+            raise ValueError(f"{name}: unknown phase {p.kind!r}")
+    for m in event.start_messages:
+        for asset in m.assets:
+            check_asset(name, asset)
+    check_asset(name, event.end_asset)
+    return event
+
+
+def load_events(fp: str = PATH_EVENTS) -> dict[str, EventDefinition]:
+    with open(fp, "rb") as file:
+        t = tomllib.load(file)
+
+    events = {}
+    for e in t.get("events", ()):
+        if not e.get("enabled", True):
+            continue
+        event = parse_event(e)
+        events[event.name] = event
+    return events
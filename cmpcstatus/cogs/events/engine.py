@@ -0,0 +1,449 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Mapping, Optional
+
+import discord
+from discord import Embed, TextChannel
+
+from cmpcstatus.cogs import BotCog
+from cmpcstatus.cogs.events._definition import (
+    EventDefinition,
+    Phase,
+    PhaseKind,
+    load_events,
+)
+from cmpcstatus.constants import (
+    COLOUR_BLUE,
+    COUNTDOWN_MINUTE,
+    COUNTDOWN_MINUTES,
+    EVENTS_POLL_INTERVAL,
+    PATH_EVENTS,
+    SHUTDOWN_TIMEOUT,
+    TESTING,
+    TZ_AMSTERDAM,
+)
+from cmpcstatus.database import get_state, set_state
+
+log = logging.getLogger(__name__)
+
+
+if TESTING:
+    COUNTDOWN_MINUTE = 2
+
+
+class EventEngine(BotCog):
+    """Runs every event in events.toml from a single schedule.
+
+    The schedule is a sorted list of the next time each phase of each event
+    runs. One task sleeps until the head of that list, runs everything due
+    at that moment and recomputes the fired entries. The definitions are
+    reloaded whenever events.toml changes.
+
+    The last phase each event completed and its pending countdown are kept
+    in the state table. On startup every channel is brought to the phase it
+    should be in, so fire times missed while the bot was down are caught up.
+    """
+
+    def __init__(self, *args, path: str = PATH_EVENTS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.mtime: Optional[float] = None
+        self.events: dict[str, EventDefinition] = {}
+        self.schedule: list[tuple[datetime.datetime, str, PhaseKind]] = []
+        self.scheduler: Optional[asyncio.Task] = None
+        # phases the scheduler is running right now
+        self.running: Optional[asyncio.Future] = None
+        # lock countdowns run separately so phases return straight away
+        self.countdowns: dict[str, asyncio.Task] = {}
+
+    async def cog_load(self):
+        self.load()
+        self.scheduler = asyncio.create_task(self.run_schedule(), name="events")
+
+    async def cog_unload(self):
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+        # a phase that already started gets to finish its edits and messages
+        if self.running is not None and not self.running.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self.running), SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                log.warning("Dropped running event phases")
+                self.running.cancel()
+        for name in tuple(self.countdowns):
+            await self.stop_countdown(name)
+
+    def load(self):
+        """(Re)load the event definitions and rebuild the schedule.
+
+        Nothing changes unless the whole file is valid.
+        """
+        mtime = os.stat(self.path).st_mtime
+        events = load_events(self.path)
+        self.mtime = mtime
+        self.events = events
+        self.rebuild_schedule()
+        log.info("Loaded events: %s", ", ".join(self.events) or "none")
+
+    def rebuild_schedule(self, after: Optional[datetime.datetime] = None):
+        """Schedule every phase after `after`, now if not given."""
+        if after is None:
+            after = datetime.datetime.now(TZ_AMSTERDAM)
+        self.schedule = []
+        for event in self.events.values():
+            for phase in event.phases:
+                self.add_to_schedule(event, phase, after)
+
+    def maybe_reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            log.warning("Could not check events: %s", e)
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            # keep running the old definitions
+            self.mtime = mtime
+            log.error("Could not reload events: %s", e)
+
+    def add_to_schedule(
+        self, event: EventDefinition, phase: Phase, after: datetime.datetime
+    ):
+        when = event.next_phase(phase, after)
+        if when is not None:
+            self.schedule.append((when, event.name, phase.kind))
+            self.schedule.sort()
+
+    async def run_schedule(self):
+        await self.bot.wait_until_ready()
+        try:
+            reconciled = await self.reconcile()
+        except Exception:
+            log.exception("Could not reconcile events")
+        else:
+            # phases that came due while waiting for discord were just caught up
+            self.rebuild_schedule(reconciled)
+        while True:
+            try:
+                await self.run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # the schedule is rebuilt so a bad entry doesn't come back
+                log.exception("Event scheduler failed")
+                self.rebuild_schedule()
+                await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+    async def run_due(self):
+        """Wait for the head of the schedule and run everything due then."""
+        self.maybe_reload()
+        now = datetime.datetime.now(TZ_AMSTERDAM)
+        if not self.schedule:
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+            return
+        when = self.schedule[0][0]
+        # wake up now and then to notice changes to the definitions
+        if (when - now).total_seconds() > EVENTS_POLL_INTERVAL:
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+            return
+        await discord.utils.sleep_until(when)
+
+        due = [s for s in self.schedule if s[0] <= when]
+        self.schedule = self.schedule[len(due) :]
+        # events sharing a channel run in order, other channels at once
+        by_channel = defaultdict(list)
+        for _, name, kind in due:
+            event = self.events[name]
+            by_channel[event.channel_id].append((event, kind, when))
+            self.add_to_schedule(event, event.get_phase(kind), when)
+        self.running = asyncio.gather(
+            *(self.run_phases(phases) for phases in by_channel.values())
+        )
+        # unloading the cog cancels the scheduler, not the phases
+        await asyncio.shield(self.running)
+
+    async def run_phases(
+        self, phases: list[tuple[EventDefinition, PhaseKind, datetime.datetime]]
+    ):
+        for event, kind, when in phases:
+            try:
+                state = await self.load_state(event)
+                # state is per event, another phase may have run at this moment
+                if (
+                    state is not None
+                    and state["phase"] == kind
+                    and state["at"] >= when.timestamp()
+                ):
+                    log.info("%s %s already ran", event.name, kind)
+                    continue
+                await self.run_phase(event, kind, when)
+            except Exception:
+                log.exception("%s %s failed", event.name, kind)
+
+    async def run_phase(
+        self,
+        event: EventDefinition,
+        kind: PhaseKind,
+        when: Optional[datetime.datetime] = None,
+    ):
+        """Run a phase that was due at `when`, now if not given."""
+        phase = event.get_phase(kind)
+        if phase is None:
+            raise ValueError(f"{event.name} has no {kind} phase")
+        channel = self.get_channel(event)
+        if channel is None:
+            return
+        if when is None:
+            when = datetime.datetime.now(TZ_AMSTERDAM)
+        log.info("%s %s", event.name, kind)
+        countdown = None
+        if kind == "start":
+            await self.event_start(event, phase, channel)
+        elif kind == "lock":
+            deadline = when.timestamp() + COUNTDOWN_MINUTES * COUNTDOWN_MINUTE
+            countdown = await self.event_lock(event, phase, channel, deadline)
+        else:
+            await self.event_end(event, phase, channel)
+        await self.save_state(event, kind, when, countdown)
+
+    @staticmethod
+    def state_key(event: EventDefinition) -> str:
+        return f"event:{event.name}"
+
+    async def load_state(self, event: EventDefinition) -> Optional[dict]:
+        value = await get_state(self.bot.db, self.state_key(event))
+        return json.loads(value) if value is not None else None
+
+    async def save_state(
+        self,
+        event: EventDefinition,
+        kind: PhaseKind,
+        when: datetime.datetime,
+        countdown: Optional[dict] = None,
+    ):
+        """Remember the last completed phase and the countdown it left running."""
+        value = {"phase": kind, "at": when.timestamp(), "countdown": countdown}
+        await set_state(self.bot.db, self.state_key(event), json.dumps(value))
+
+    async def reconcile(self) -> datetime.datetime:
+        """Bring every event channel to the phase it should be in right now.
+
+        Of all events sharing a channel only the one whose phase ran last
+        decides its state. Phases that were missed are run late, phases that
+        did complete are only checked against the cached channel, which
+        costs no API calls when nothing changed while the bot was down.
+        Return the time reconciled to.
+        """
+        now = datetime.datetime.now(TZ_AMSTERDAM)
+        latest: dict[int, tuple[datetime.datetime, EventDefinition, Phase]] = {}
+        for event in self.events.values():
+            for phase in event.phases:
+                when = event.previous_phase(phase, now)
+                if when is None:
+                    continue
+                current = latest.get(event.channel_id)
+                if current is None or when > current[0]:
+                    latest[event.channel_id] = (when, event, phase)
+
+        for when, event, phase in latest.values():
+            try:
+                await self.catch_up(event, phase, when)
+            except Exception:
+                log.exception("Could not reconcile %s", event.name)
+        return now
+
+    async def catch_up(
+        self, event: EventDefinition, phase: Phase, when: datetime.datetime
+    ):
+        channel = self.get_channel(event)
+        if channel is None:
+            return
+        state = await self.load_state(event)
+        if state is None:
+            # nothing saved for this event, e.g. the first run with the state
+            # table, so whatever it sent may already be there
+            log.info("No state for %s, only checking the channel", event.name)
+            await self.sync_channel(event, phase, channel)
+            await self.save_state(event, phase.kind, when)
+            return
+        done = state["phase"] == phase.kind and state["at"] >= when.timestamp()
+        if not done:
+            log.warning("Catching up on %s %s from %s", event.name, phase.kind, when)
+            await self.run_phase(event, phase.kind, when)
+            return
+
+        await self.sync_channel(event, phase, channel)
+        countdown = state["countdown"]
+        if countdown is not None and countdown["deadline"] > time.time():
+            await self.resume_countdown(event, channel, countdown)
+
+    async def sync_channel(
+        self, event: EventDefinition, phase: Phase, channel: TextChannel
+    ):
+        if phase.kind == "start":
+            name, topic = event.channel_name, event.channel_topic
+        else:
+            name = topic = None
+        reason = f"{event.name} {phase.kind}"
+        await self.update_channel(channel, phase.permissions, reason, name, topic)
+
+    def get_channel(self, event: EventDefinition) -> Optional[TextChannel]:
+        channel = self.bot.get_channel(event.channel_id)
+        # when running as several shard processes only one of them has the channel
+        if channel is None and self.bot.shard_ids is None:
+            raise ValueError(f"Could not find channel {event.channel_id}")
+        return channel
+
+    @staticmethod
+    async def update_channel(
+        channel: TextChannel,
+        permissions: Mapping[str, bool],
+        reason: str,
+        name: Optional[str] = None,
+        topic: Optional[str] = None,
+    ) -> bool:
+        """Bring the channel to the desired state in at most one API call.
+
+        Only fields that differ from the cached channel are sent.
+        Return whether an edit was needed.
+        """
+        changes = {}
+        if name is not None and channel.name != name:
+            changes["name"] = name
+        if topic is not None and channel.topic != topic:
+            changes["topic"] = topic
+
+        role = channel.guild.default_role
+        current = channel.overwrites_for(role)
+        perms = discord.PermissionOverwrite(**dict(current))
+        perms.update(**permissions)
+        if perms != current:
+            overwrites = dict(channel.overwrites)
+            overwrites[role] = perms
+            changes["overwrites"] = overwrites
+
+        if not changes:
+            log.debug("%s already up to date", channel)
+            return False
+        await channel.edit(**changes, reason=reason)
+        return True
+
+    async def event_start(
+        self, event: EventDefinition, phase: Phase, channel: TextChannel
+    ):
+        # rename and open channel
+        await self.update_channel(
+            channel,
+            phase.permissions,
+            f"{event.name} start",
+            name=event.channel_name,
+            topic=event.channel_topic,
+        )
+
+        # send start messages
+        for m in event.start_messages:
+            await self.bot.uploads.send(channel, m.assets, content=m.content)
+
+    async def event_lock(
+        self,
+        event: EventDefinition,
+        phase: Phase,
+        channel: TextChannel,
+        deadline: float,
+    ) -> dict:
+        # set channel to read-only
+        await self.update_channel(channel, phase.permissions, f"{event.name} lock")
+
+        # create countdown message
+        embed = Embed(title=event.end_message, color=COLOUR_BLUE)
+        message = await self.bot.uploads.send(
+            channel, embed=embed, embed_image=event.end_asset
+        )
+
+        # edit message until countdown ends
+        self.start_countdown(event, message, embed, deadline)
+        return {
+            "channel_id": channel.id,
+            "message_id": message.id,
+            "deadline": deadline,
+        }
+
+    async def resume_countdown(
+        self, event: EventDefinition, channel: TextChannel, countdown: dict
+    ):
+        try:
+            message = await channel.fetch_message(countdown["message_id"])
+        except discord.NotFound:
+            log.warning("%s countdown message is gone", event.name)
+            return
+        if not message.embeds:
+            return
+        log.info("Resuming %s countdown", event.name)
+        self.start_countdown(event, message, message.embeds[0], countdown["deadline"])
+
+    def start_countdown(
+        self,
+        event: EventDefinition,
+        message: discord.Message,
+        embed: Embed,
+        deadline: float,
+    ):
+        old = self.countdowns.pop(event.name, None)
+        if old is not None:
+            old.cancel()
+        self.countdowns[event.name] = asyncio.create_task(
+            self.countdown(message, embed, deadline), name=f"{event.name} countdown"
+        )
+
+    async def event_end(
+        self, event: EventDefinition, phase: Phase, channel: TextChannel
+    ):
+        await self.stop_countdown(event.name)
+        # hide channel
+        await self.update_channel(channel, phase.permissions, f"{event.name} end")
+
+    @staticmethod
+    async def countdown(message: discord.Message, embed: Embed, deadline: float):
+        """Count down the minutes on the lock message until the unix time deadline.
+
+        Each edit is scheduled against the deadline rather than the previous
+        sleep, so a slow edit, a reconnect or a restart skips ahead instead
+        of drifting. Cancelling the task still leaves the final message in place.
+        """
+        # a resumed message may still show the field from before the restart
+        embed.clear_fields()
+        embed.add_field(name="", value="")
+        try:
+            for i in range(COUNTDOWN_MINUTES, 0, -1):
+                edit_at = deadline - i * COUNTDOWN_MINUTE
+                # already past this minute, e.g. after a reconnect
+                if time.time() >= edit_at + COUNTDOWN_MINUTE:
+                    continue
+                await asyncio.sleep(edit_at - time.time())
+                s = "s" if i != 1 else ""
+                name = f"In {i} minute{s} this channel will be hidden."
+                embed.set_field_at(0, name=name, value="** **", inline=False)
+                try:
+                    await message.edit(embed=embed)
+                except discord.HTTPException as e:
+                    log.warning("Could not update countdown: %s", e)
+            await asyncio.sleep(deadline - time.time())
+        finally:
+            # leave a final message
+            embed.remove_field(0)
+            await message.edit(embed=embed)
+
+    async def stop_countdown(self, name: str):
+        task = self.countdowns.pop(name, None)
+        if task is None or task.done():
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
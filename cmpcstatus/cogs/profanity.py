@@ -1,32 +1,139 @@
-from typing import Optional
+import string
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from tempfile import TemporaryFile
+from typing import Collection, Optional, Sequence
 
 import aiosqlite
 import discord
-from better_profanity import profanity
 from discord import Member, Message, utils
 from discord.ext import commands
 from discord.ext.commands import Context
 
+from cmpcstatus.classifiers import ProfanityClassifier, get_classifier
 from cmpcstatus.cogs import BotCog
 from cmpcstatus.constants import (
     MENTION_NONE,
-    PATH_DATABASE,
+    PROFANITY_CACHE_SIZE,
     PROFANITY_INTERCEPT,
     PROFANITY_ROWS_DEFAULT,
     PROFANITY_ROWS_INLINE,
     PROFANITY_ROWS_MAX,
     ROLE_DEVELOPER,
 )
+from cmpcstatus.export import export_lb, import_lb
+from cmpcstatus.leaderboard import Leaderboard
+from cmpcstatus.scanner import HistoryConsumer, HistoryScanner, ScanProgress
 
+ZERO_WIDTH = "\u00ad\u200b\u200c\u200d\u2060\ufeff"
+# zero-width characters are dropped, lookalike letters and leet become ascii
+FOLD_TABLE = str.maketrans(
+    {
+        **dict.fromkeys(ZERO_WIDTH),
+        # cyrillic and greek lookalikes
+        "а": "a",
+        "в": "b",
+        "е": "e",
+        "к": "k",
+        "м": "m",
+        "н": "h",
+        "о": "o",
+        "р": "p",
+        "с": "c",
+        "т": "t",
+        "у": "y",
+        "х": "x",
+        "і": "i",
+        "ѕ": "s",
+        "α": "a",
+        "ο": "o",
+        "ν": "v",
+        # leet
+        "0": "o",
+        "1": "i",
+        "3": "e",
+        "4": "a",
+        "5": "s",
+        "7": "t",
+        "@": "a",
+        "$": "s",
+        "!": "i",
+    }
+)
+PUNCTUATION = string.punctuation + "…“”‘’«»¡¿"
+# "$" and "@" are letters in "a$$" and "@ss"
+PUNCTUATION_NOT_LEET = PUNCTUATION.translate(str.maketrans("", "", "$@"))
+DROP_ZERO_WIDTH = str.maketrans("", "", ZERO_WIDTH)
+
+
+# words as people wrote them, for cogs.words, without the leet and lookalike
+# folding, which would turn "100" into "ioo"
+@lru_cache(maxsize=PROFANITY_CACHE_SIZE)
+def plain_word(token: str) -> str:
+    word = unicodedata.normalize("NFKC", token).casefold()
+    return word.translate(DROP_ZERO_WIDTH).strip(PUNCTUATION)
+
+
+def normalize_word(token: str) -> str:
+    """The canonical form of a token, as stored in lb.word."""
+    if token in PROFANITY_INTERCEPT:
+        return token
+    word = unicodedata.normalize("NFKC", token).casefold()
+    # strip first so trailing "!" or "..." don't turn into letters
+    word = word.strip(PUNCTUATION_NOT_LEET + ZERO_WIDTH)
+    return word.translate(FOLD_TABLE).strip(PUNCTUATION)
+
+
+class VerdictCache:
+    """Normalized form and verdict of raw tokens, least recently used dropped.
+
+    Most chat repeats the same few thousand tokens, so only the rest reach
+    the classifier, all in one batch per call.
+    """
+
+    def __init__(self, maxsize: int = PROFANITY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.classifier: Optional[ProfanityClassifier] = None
+        self.verdicts: OrderedDict[str, tuple[str, bool]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def set_classifier(self, classifier: ProfanityClassifier):
+        # verdicts from another classifier no longer hold
+        self.classifier = classifier
+        self.verdicts.clear()
+
+    def classify(self, tokens: Sequence[str]) -> list[tuple[str, bool]]:
+        """Return the normalized token and whether it is a swear, for each token."""
+        verdicts = self.verdicts
+        unknown = [t for t in dict.fromkeys(tokens) if t not in verdicts]
+        self.misses += len(unknown)
+        self.hits += len(tokens) - len(unknown)
+        if unknown:
+            words = [normalize_word(t) for t in unknown]
+            # words the bot counts whatever the classifier thinks
+            batch = [w for w in words if w and w not in PROFANITY_INTERCEPT]
+            predictions = dict(zip(batch, self.classifier.predict(batch)))
+            for token, word in zip(unknown, words):
+                is_swear = word in PROFANITY_INTERCEPT or predictions.get(word, False)
+                verdicts[token] = (word, is_swear)
+
+        result = []
+        for t in tokens:
+            verdicts.move_to_end(t)
+            result.append(verdicts[t])
+        while len(verdicts) > self.maxsize:
+            verdicts.popitem(last=False)
+        return result
 
-# wraps the library to make it easier to swap out
-# if I want to switch to the ml one
-# that's machine learning not marxist-leninism thankfully
-def profanity_predict(words: list[str]) -> list[bool]:
-    profanity_array = [
-        (w in PROFANITY_INTERCEPT or profanity.contains_profanity(w)) for w in words
-    ]
-    return profanity_array
+
+VERDICTS = VerdictCache()
+
+
+def classify_token(token: str) -> tuple[str, bool]:
+    """Return the normalized token and whether it is a swear."""
+    return VERDICTS.classify((token,))[0]
 
 
 class ProfanityLeaderboard(BotCog):
@@ -34,83 +141,136 @@ class ProfanityLeaderboard(BotCog):
         super().__init__(*args, **kwargs)
 
         self.conn: Optional[aiosqlite.Connection] = None
+        self.leaderboard: Optional[Leaderboard] = None
         self.profanity_intercept = PROFANITY_INTERCEPT
-        profanity.load_censor_words()
-        profanity.add_censor_words(self.profanity_intercept)
+        VERDICTS.set_classifier(get_classifier(self.bot.config.profanity))
 
     async def cog_load(self):
-        self.conn = await aiosqlite.connect(PATH_DATABASE)
-        await self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS lb (
-                message_id INTEGER NOT NULL,
-                created_at REAL NOT NULL,
-                author_id INTEGER NOT NULL,
-                word TEXT NOT NULL,
-                position INTEGER NOT NULL,
-                PRIMARY KEY (message_id, position)
-            );
-            """
-        )
-        await self.conn.commit()
+        self.conn = self.bot.db
+        self.leaderboard = Leaderboard(self.conn)
 
-    async def cog_unload(self):
-        await self.conn.close()
+    @staticmethod
+    def find_swears(content: str) -> dict[int, str]:
+        """Map word position to swear for every swear in content."""
+        return ProfanityLeaderboard.find_swears_many((content,))[0]
 
-    @commands.Cog.listener(name="on_message")
-    async def process_profanity(self, message: Message) -> int:
-        """Return the number of swears added to the database."""
-        lower = message.content.casefold()
-        mwords = lower.split()
-        profanity_array = profanity_predict(mwords)
-        swears = {i: word for i, word in enumerate(mwords) if profanity_array[i]}
-        if not swears:
-            return 0
+    @staticmethod
+    def find_swears_many(contents: Sequence[str]) -> list[dict[int, str]]:
+        """find_swears for many messages, classified in one batch."""
+        tokenized = [c.casefold().split() for c in contents]
+        verdicts = iter(VERDICTS.classify([t for tokens in tokenized for t in tokens]))
+        result = []
+        for tokens in tokenized:
+            swears = {}
+            for i, (word, is_swear) in zip(range(len(tokens)), verdicts):
+                if is_swear:
+                    swears[i] = word
+            result.append(swears)
+        return result
 
-        timestamp = message.created_at.timestamp()
+    async def insert_swears(
+        self,
+        guild_id: int,
+        message_id: int,
+        created_at: float,
+        author_id: int,
+        swears: dict[int, str],
+    ):
         await self.conn.executemany(
             """
-            INSERT INTO lb (message_id, created_at, author_id, word, position)
-            VALUES (:message_id, :created_at, :author_id, :word, :position);
+            INSERT INTO lb (message_id, created_at, author_id, word, position, guild_id)
+            VALUES (:message_id, :created_at, :author_id, :word, :position, :guild_id);
             """,
             (
                 {
-                    "message_id": message.id,
-                    "created_at": timestamp,
-                    "author_id": message.author.id,
+                    "message_id": message_id,
+                    "created_at": created_at,
+                    "author_id": author_id,
+                    "guild_id": guild_id,
                     "word": word,
                     "position": position,
                 }
                 for position, word in swears.items()
             ),
         )
+
+    @commands.Cog.listener(name="on_message")
+    async def process_profanity(self, message: Message) -> int:
+        """Return the number of swears added to the database."""
+        if message.guild is None:
+            return 0
+        tokens = message.content.casefold().split()
+        verdicts = VERDICTS.classify(tokens)
+        # the same split feeds the word counts, see cogs.words
+        words = [w for w in map(plain_word, tokens) if w]
+        self.bot.dispatch("message_words", message, words)
+        swears = {i: w for i, (w, is_swear) in enumerate(verdicts) if is_swear}
+        if not swears:
+            return 0
+
+        timestamp = message.created_at.timestamp()
+        await self.insert_swears(
+            message.guild.id, message.id, timestamp, message.author.id, swears
+        )
         await self.conn.commit()
         return len(swears)
 
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """Rescore an edited message, touching only the positions that changed."""
+        data = payload.data
+        # embed unfurls etc. also send updates, without content
+        if payload.guild_id is None or "content" not in data or "author" not in data:
+            return
+        new = self.find_swears(data["content"])
+        async with self.conn.execute_fetchall(
+            "SELECT position, word FROM lb WHERE message_id=:message_id",
+            {"message_id": payload.message_id},
+        ) as rows:
+            old = dict(rows)
+        if old == new:
+            return
+
+        removed = [p for p, w in old.items() if new.get(p) != w]
+        added = {p: w for p, w in new.items() if old.get(p) != w}
+        await self.conn.executemany(
+            "DELETE FROM lb WHERE message_id=:message_id AND position=:position",
+            ({"message_id": payload.message_id, "position": p} for p in removed),
+        )
+        created_at = utils.snowflake_time(payload.message_id).timestamp()
+        author_id = int(data["author"]["id"])
+        await self.insert_swears(
+            payload.guild_id, payload.message_id, created_at, author_id, added
+        )
+        await self.conn.commit()
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        await self.delete_messages((payload.message_id,))
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        await self.delete_messages(payload.message_ids)
+
+    async def delete_messages(self, message_ids: Collection[int]):
+        if not message_ids:
+            return
+        # bulk deletes are capped at 100 messages, well under the variable limit
+        params = ", ".join("?" for _ in message_ids)
+        await self.conn.execute(
+            f"DELETE FROM lb WHERE message_id IN ({params})", tuple(message_ids)
+        )
+        await self.conn.commit()
+
     class ProfanityConverter(commands.Converter[str]):
         async def convert(self, ctx: Context, argument: str) -> str:
-            word = argument.casefold()
-            check = profanity_predict([word])[0]
+            word, check = classify_token(argument.casefold())
             if not check:
                 raise commands.BadArgument("Not a swear! L boomer.")
             return word
 
-    async def get_total(
-        self, author_id: int = None, word: ProfanityConverter = None
-    ) -> int:
-        # ¿Quieres?
-        if author_id is not None:
-            query = "SELECT COUNT(*) FROM lb WHERE author_id=:author_id"
-        elif word is not None:
-            query = "SELECT COUNT(*) FROM lb WHERE word=:word"
-        else:
-            query = "SELECT COUNT(*) FROM lb"
-
-        arg = {"author_id": author_id, "word": word}
-        async with self.conn.execute_fetchall(query, arg) as rows:
-            total = rows[0][0]
-        return total
-
     @staticmethod
     def limit_rows(rows: Optional[int]) -> tuple[int, bool]:
         if rows is None:
@@ -122,40 +282,33 @@ class ProfanityLeaderboard(BotCog):
         return rows, inline
 
     @commands.hybrid_command(aliases=("leaderboard", "lb"))
+    @commands.guild_only()
     async def leaderboard_person(
         self, ctx: Context, person: Optional[Member], rows: Optional[int]
     ):
         embed = discord.Embed()
+        guild = ctx.guild
         rows, inline = self.limit_rows(rows)
-        arg = {"rows": rows}
 
         if person is not None:
-            where = "WHERE author_id=:author_id"
-            arg["author_id"] = person.id
             embed.set_author(name=person.name, icon_url=person.display_avatar.url)
-            total = await self.get_total(author_id=person.id, word=None)
         else:
-            where = ""
-            guild = ctx.guild
             icon_url = guild.icon.url if guild.icon is not None else None
             embed.set_author(name=guild.name, icon_url=icon_url)
-            total = await self.get_total()
 
+        author_id = person.id if person is not None else None
+        top, total = await self.leaderboard.top(
+            guild.id, "word", rows, author_id=author_id
+        )
         embed.set_footer(text=f"Total: {total}")
-        query = f"""
-                SELECT word, COUNT(*) AS num FROM lb
-                {where}
-                GROUP BY word ORDER BY num DESC
-                LIMIT :rows;
-                """
-        async with self.conn.execute_fetchall(query, arg) as rows:
-            for word, count in rows:
-                embed.add_field(name=count, value=word, inline=inline)
+        for word, count in top:
+            embed.add_field(name=count, value=word, inline=inline)
 
         await ctx.send(embed=embed, allowed_mentions=MENTION_NONE)
 
     # lock bicking lawyer
     @commands.hybrid_command(aliases=("leaderblame", "lbl"))
+    @commands.guild_only()
     async def leaderboard_word(
         self,
         ctx: Context,
@@ -167,30 +320,13 @@ class ProfanityLeaderboard(BotCog):
         guild = ctx.guild
         icon_url = guild.icon.url if guild.icon is not None else None
         rows, inline = self.limit_rows(rows)
-        arg = {"rows": rows}
-
-        if word is not None:
-            where = "WHERE word=:word"
-            arg["word"] = word
-            embed.set_author(name=word, icon_url=icon_url)
-            total = await self.get_total(author_id=None, word=word)
-        else:
-            where = ""
-            embed.set_author(name=guild.name, icon_url=icon_url)
-            total = await self.get_total()
+        embed.set_author(name=word or guild.name, icon_url=icon_url)
 
+        top, total = await self.leaderboard.top(guild.id, "author_id", rows, word=word)
         embed.set_footer(text=f"Total: {total}")
-        query = f"""
-                SELECT author_id, COUNT(*) AS num FROM lb
-                {where}
-                GROUP BY author_id ORDER BY num DESC
-                LIMIT :rows
-                """
-        async with self.conn.execute_fetchall(query, arg) as rows:
-            for author_id, count in rows:
-                member = utils.get(guild.members, id=author_id)
-                mention = f"<@{author_id}>" if member is None else member.mention
-                embed.add_field(name=count, value=mention, inline=inline)
+        # the client renders the mention itself, so members aren't looked up
+        for author_id, count in top:
+            embed.add_field(name=count, value=f"<@{author_id}>", inline=inline)
         await ctx.send(embed=embed, allowed_mentions=MENTION_NONE)
 
     @commands.command(hidden=True)
@@ -202,48 +338,126 @@ class ProfanityLeaderboard(BotCog):
         around: Optional[Message],
         *channels: discord.TextChannel,
     ):
+        consumer = self.make_history_consumer()
         for c in channels:
             status_message = await ctx.send(f"Loading history {c.mention}")
-            count = 0
-            swears = 0
-            ignored = 0
-
-            async def update_status():
-                await status_message.edit(
-                    content=f"Messages {count}, ignored {ignored}, swears {swears} in {c.mention}"
-                )
-
-            async for message in c.history(limit=limit, around=around):
-                count += 1
-                try:
-                    swears += await self.process_profanity(message)
-                except aiosqlite.IntegrityError:
-                    ignored += 1
-                if count % 1000 == 0:
-                    await update_status()
-            await update_status()
+
+            async def update_status(progress: ScanProgress):
+                await status_message.edit(content=f"{progress}, {consumer.summary()}")
+
+            scanner = HistoryScanner((consumer,), on_progress=update_status)
+            await scanner.scan(c, limit=limit, around=around)
             await ctx.send(f"Loaded history {c.mention}")
 
+    def make_history_consumer(self) -> "ProfanityHistory":
+        return ProfanityHistory(self)
+
+    @commands.command(hidden=True)
+    @commands.has_role(ROLE_DEVELOPER)
+    async def profanity_cache(self, ctx: Context):
+        v = VERDICTS
+        lookups = v.hits + v.misses
+        rate = v.hits / lookups if lookups else 0
+        await ctx.send(
+            f"{v.classifier.name} classifier, {len(v.verdicts)}/{v.maxsize} tokens,"
+            f" {v.hits} hits, {v.misses} misses ({rate:.1%} hit rate)"
+        )
+
     @commands.command(hidden=True)
     @commands.has_role(ROLE_DEVELOPER)
     async def trim_database(self, ctx: Context):
         """Remove entries with deleted users."""
         await ctx.send("Trimming")
         async with self.conn.execute_fetchall(
-            "SELECT DISTINCT author_id FROM lb"
+            "SELECT DISTINCT author_id FROM lb WHERE guild_id=:guild_id",
+            {"guild_id": ctx.guild.id},
         ) as rows:
             author_ids = frozenset(r[0] for r in rows)
         await ctx.send(f"Database {len(author_ids)}")
 
-        member_ids = frozenset(m.id for m in ctx.guild.members)
-        await ctx.send(f"Guild {len(member_ids)}")
-        # set magic
-        missing_author_ids = author_ids - (member_ids & author_ids)
-        await ctx.send(f"Removing {len(missing_author_ids)}")
+        # only ask about the authors, not every member of the guild
+        members = await self.bot.member_cache.resolve(
+            ctx.guild, author_ids, remember=False
+        )
+        await ctx.send(f"Guild {len(members)}")
+        missing_author_ids = author_ids - members.keys()
+        removed = await self.leaderboard.totals(
+            ctx.guild.id, "author_id", missing_author_ids
+        )
+        await ctx.send(
+            f"Removing {len(missing_author_ids)} authors"
+            f" with {sum(removed.values())} swears"
+        )
 
         await self.conn.executemany(
-            "DELETE FROM lb WHERE author_id=:author_id",
-            parameters=({"author_id": a} for a in missing_author_ids),
+            "DELETE FROM lb WHERE guild_id=:guild_id AND author_id=:author_id",
+            parameters=(
+                {"guild_id": ctx.guild.id, "author_id": a} for a in missing_author_ids
+            ),
         )
         await self.conn.commit()
         await ctx.send("Done trimming")
+
+    @commands.command(hidden=True)
+    @commands.has_role(ROLE_DEVELOPER)
+    async def export_database(self, ctx: Context):
+        """Upload a compressed columnar copy of the leaderboard."""
+        async with ctx.typing():
+            with TemporaryFile() as file:
+                total = await export_lb(self.conn, file)
+                file.seek(0)
+                discord_file = discord.File(file, filename="lb.cmpclb")
+                await ctx.send(f"Exported {total} rows", file=discord_file)
+
+    @commands.command(hidden=True)
+    @commands.has_role(ROLE_DEVELOPER)
+    async def import_database(self, ctx: Context):
+        """Load an attached export into the leaderboard, skipping duplicates."""
+        if not ctx.message.attachments:
+            raise commands.BadArgument("Attach an export file.")
+        async with ctx.typing():
+            with TemporaryFile() as file:
+                await ctx.message.attachments[0].save(file)
+                file.seek(0)
+                total = await import_lb(self.conn, file)
+        await ctx.send(f"Imported {total} rows")
+
+
+class ProfanityHistory(HistoryConsumer):
+    """Scores old messages into the leaderboard, one transaction per batch."""
+
+    name = "profanity"
+
+    def __init__(self, cog: ProfanityLeaderboard):
+        self.cog = cog
+        self.swears = 0
+        self.ignored = 0
+
+    async def consume(self, messages: Sequence[Message]):
+        messages = [m for m in messages if m.guild is not None]
+        swears = self.cog.find_swears_many([m.content for m in messages])
+        rows = [
+            (m.id, m.created_at.timestamp(), m.author.id, word, position, m.guild.id)
+            for m, found in zip(messages, swears)
+            for position, word in found.items()
+        ]
+        if not rows:
+            return
+        conn = self.cog.conn
+        before = conn.total_changes
+        # rows already in the database are skipped
+        await conn.executemany(
+            """
+            INSERT OR IGNORE INTO lb
+            (message_id, created_at, author_id, word, position, guild_id)
+            VALUES (?, ?, ?, ?, ?, ?);
+            """,
+            rows,
+        )
+        await conn.commit()
+        added = conn.total_changes - before
+        self.swears += added
+        self.ignored += len(rows) - added
+
+    def summary(self) -> str:
+        return f"swears {self.swears}, ignored {self.ignored}"
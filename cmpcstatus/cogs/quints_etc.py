@@ -1,11 +1,164 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Optional, Sequence
+
+import aiosqlite
+import discord
 from discord import Message
 from discord.ext import commands
 from discord.ext.commands import Cog, Context
 
-from cmpcstatus.constants import ROLE_DEVELOPER
+from cmpcstatus.cogs import BotCog
+from cmpcstatus.constants import (
+    MENTION_NONE,
+    QUINTS_BATCH_ROWS,
+    QUINTS_FLUSH_DELAY,
+    QUINTS_MIN_DIGITS,
+    QUINTS_ROWS_DEFAULT,
+    QUINTS_ROWS_MAX,
+    ROLE_DEVELOPER,
+)
+from cmpcstatus.scanner import HistoryConsumer
+
+log = logging.getLogger(__name__)
+
+# only used to speed up history scans
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SCHEMA_QUINTS = """
+CREATE TABLE IF NOT EXISTS quints (
+    message_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    digits INTEGER NOT NULL
+);
+-- top holders group by author, rarest hits sort by digits
+CREATE INDEX IF NOT EXISTS quints_guild_author ON quints (guild_id, author_id, digits);
+CREATE INDEX IF NOT EXISTS quints_guild_digits ON quints (guild_id, digits, message_id);
+"""
+
+QUERY_TOP_HOLDERS = """
+SELECT author_id, COUNT(*) AS num, MAX(digits) FROM quints
+WHERE guild_id=:guild_id
+GROUP BY author_id ORDER BY num DESC
+LIMIT :rows;
+"""
+
+QUERY_RAREST = """
+SELECT message_id, channel_id, author_id, digits FROM quints
+WHERE guild_id=:guild_id
+ORDER BY digits DESC, message_id ASC
+LIMIT :rows;
+"""
+
+LedgerRow = tuple[int, int, int, int, int]
+
+
+def consecutive_digits_many(ids: Sequence[int]) -> list[int]:
+    """Quints.consecutive_digits for a whole batch of IDs."""
+    if np is None:
+        runs = []
+        for i in ids:
+            s = str(i)
+            runs.append(len(s) - len(s.rstrip(s[-1])))
+        return runs
+    # snowflakes fit in 63 bits
+    number = np.fromiter(ids, dtype=np.uint64, count=len(ids))
+    digit = number % 10
+    number //= 10
+    runs = np.ones(len(ids), dtype=np.int64)
+    alive = np.ones(len(ids), dtype=bool)
+    # most IDs stop after the first digit, so this ends after a few rounds
+    while True:
+        alive &= (number > 0) & (number % 10 == digit)
+        if not alive.any():
+            break
+        runs += alive
+        number //= 10
+    return runs.tolist()
+
+
+class QuintsLedger:
+    """Writes qualifying messages to the quints table in batches.
+
+    A batch is written once it has QUINTS_BATCH_ROWS rows, or
+    QUINTS_FLUSH_DELAY seconds after its first row, whichever comes first.
+    Messages already in the table are skipped. A batch that could not be
+    written goes back in the buffer for the next flush.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self.conn = conn
+        self.rows: list[LedgerRow] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.pending: set[asyncio.Task] = set()
+        self.lock = asyncio.Lock()
+        self.written = 0
+
+    @staticmethod
+    def row(message: Message, digits: int) -> LedgerRow:
+        return (
+            message.id,
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            digits,
+        )
+
+    async def add(self, rows: Sequence[LedgerRow]):
+        self.rows.extend(rows)
+        if len(self.rows) >= QUINTS_BATCH_ROWS:
+            await self.flush()
+        elif self.rows and self.timer is None:
+            loop = asyncio.get_running_loop()
+            self.timer = loop.call_later(QUINTS_FLUSH_DELAY, self.flush_later)
+
+    def flush_later(self):
+        task = asyncio.create_task(self.try_flush())
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        try:
+            async with self.lock:
+                before = self.conn.total_changes
+                await self.conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO quints
+                    (message_id, guild_id, channel_id, author_id, digits)
+                    VALUES (?, ?, ?, ?, ?);
+                    """,
+                    rows,
+                )
+                await self.conn.commit()
+                self.written += self.conn.total_changes - before
+        except BaseException:
+            self.rows[:0] = rows
+            raise
 
+    async def try_flush(self):
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("Could not write %d quints", len(self.rows))
 
-class Quints(Cog):
+    async def close(self):
+        await self.flush()
+        await asyncio.gather(*self.pending, return_exceptions=True)
+
+
+class Quints(BotCog):
     gif_url = "https://giphy.com/gifs/2lQCCSp19EDAy5d7c7"
     qualifiers = {
         5: "QUINTS",
@@ -32,24 +185,117 @@ class Quints(Cog):
         else:
             return string[:length]
 
-    async def quints(self, message: Message, message_id: int):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ledger: Optional[QuintsLedger] = None
+
+    async def cog_load(self):
+        await self.bot.db.executescript(SCHEMA_QUINTS)
+        await self.bot.db.commit()
+        self.ledger = QuintsLedger(self.bot.db)
+
+    async def cog_unload(self):
+        await self.ledger.close()
+
+    async def quints(self, message: Message, message_id: int) -> int:
+        """Announce the message if its ID qualifies, return the digit run."""
         consecutive = self.consecutive_digits(message_id)
 
         qual = self.qualifiers.get(consecutive)
         if qual is None:
-            return
+            return consecutive
 
         content = self.truncate_str(message.content, 5)
 
         await message.channel.send(
             f'{message.author.name} sent "{content}..." with Message ID: {message_id} (***{qual}***)'
         )
+        return consecutive
 
     @Cog.listener()
     async def on_message(self, message: Message):
-        await self.quints(message, message.id)
+        consecutive = await self.quints(message, message.id)
+        if consecutive >= QUINTS_MIN_DIGITS and message.guild is not None:
+            await self.ledger.add((self.ledger.row(message, consecutive),))
+
+    @staticmethod
+    def limit_rows(rows: Optional[int]) -> int:
+        if rows is None:
+            return QUINTS_ROWS_DEFAULT
+        return max(1, min(rows, QUINTS_ROWS_MAX))
+
+    @commands.hybrid_command(aliases=("quintslb", "qlb"))
+    @commands.guild_only()
+    async def quints_leaderboard(self, ctx: Context, rows: Optional[int]):
+        """who has the most quints"""
+        await self.ledger.flush()
+        arg = {"guild_id": ctx.guild.id, "rows": self.limit_rows(rows)}
+        async with self.bot.db.execute_fetchall(QUERY_TOP_HOLDERS, arg) as result:
+            top = list(result)
+        embed = discord.Embed(title="Quints")
+        for author_id, count, best in top:
+            best = self.qualifiers.get(best, f"{best} digits")
+            embed.add_field(
+                name=count, value=f"<@{author_id}> (best: {best})", inline=False
+            )
+        if not top:
+            embed.description = "Nobody yet."
+        await ctx.send(embed=embed, allowed_mentions=MENTION_NONE)
+
+    @commands.hybrid_command(aliases=("rarestquints", "rq"))
+    @commands.guild_only()
+    async def rarest_quints(self, ctx: Context, rows: Optional[int]):
+        """the longest runs of digits ever sent here"""
+        await self.ledger.flush()
+        arg = {"guild_id": ctx.guild.id, "rows": self.limit_rows(rows)}
+        async with self.bot.db.execute_fetchall(QUERY_RAREST, arg) as result:
+            rarest = list(result)
+        embed = discord.Embed(title="Rarest quints")
+        for message_id, channel_id, author_id, digits in rarest:
+            url = (
+                f"https://discord.com/channels/{ctx.guild.id}/{channel_id}/{message_id}"
+            )
+            name = self.qualifiers.get(digits, f"{digits} digits")
+            embed.add_field(
+                name=name, value=f"<@{author_id}> [{message_id}]({url})", inline=False
+            )
+        if not rarest:
+            embed.description = "Nobody yet."
+        await ctx.send(embed=embed, allowed_mentions=MENTION_NONE)
 
     @commands.command(hidden=True)
     @commands.has_role(ROLE_DEVELOPER)
     async def test_quints(self, ctx: Context, message_id: int):
         await self.quints(ctx.message, message_id)
+
+    def make_history_consumer(self) -> "QuintsHistory":
+        return QuintsHistory(self.ledger)
+
+
+class QuintsHistory(HistoryConsumer):
+    """Records old qualifying messages in the ledger and counts them."""
+
+    name = "quints"
+
+    def __init__(self, ledger: QuintsLedger):
+        self.ledger = ledger
+        self.counts: Counter[str] = Counter()
+
+    async def consume(self, messages: Sequence[Message]):
+        runs = consecutive_digits_many([m.id for m in messages])
+        rows = []
+        for m, consecutive in zip(messages, runs):
+            if consecutive < QUINTS_MIN_DIGITS:
+                continue
+            qual = Quints.qualifiers.get(consecutive, f"{consecutive} digits")
+            self.counts[qual] += 1
+            if m.guild is not None:
+                rows.append(self.ledger.row(m, consecutive))
+        await self.ledger.add(rows)
+
+    async def finish(self):
+        await self.ledger.flush()
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{q} {n}" for q, n in self.counts.most_common())
+        return counts or "no quints"
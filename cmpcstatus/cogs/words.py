@@ -0,0 +1,269 @@
+import logging
+import random
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+import discord
+from discord import Member, Message
+from discord.ext import commands, tasks
+from discord.ext.commands import Context
+
+from cmpcstatus.cogs import BotCog
+from cmpcstatus.constants import (
+    MENTION_NONE,
+    WORDS_AUTHOR_TOP_K,
+    WORDS_FLUSH_INTERVAL,
+    WORDS_ROWS_DEFAULT,
+    WORDS_ROWS_MAX,
+    WORDS_SKETCH_DEPTH,
+    WORDS_SKETCH_WIDTH,
+    WORDS_TOP_K,
+    WORDS_VOCABULARY_K,
+)
+from cmpcstatus.sketch import CountMinSketch, DistinctCounter, TopK
+
+log = logging.getLogger(__name__)
+
+SCHEMA_WORDS = """
+CREATE TABLE IF NOT EXISTS word_sketch (
+    guild_id INTEGER PRIMARY KEY,
+    counts BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS word_top (
+    guild_id INTEGER NOT NULL,
+    -- 0 for the whole guild
+    author_id INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, author_id, word)
+);
+CREATE TABLE IF NOT EXISTS word_authors (
+    guild_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    vocabulary BLOB NOT NULL,
+    PRIMARY KEY (guild_id, author_id)
+);
+"""
+
+GUILD = 0
+
+
+@dataclass
+class AuthorWords:
+    top: TopK = field(default_factory=lambda: TopK(WORDS_AUTHOR_TOP_K))
+    vocabulary: DistinctCounter = field(
+        default_factory=lambda: DistinctCounter(WORDS_VOCABULARY_K)
+    )
+    total: int = 0
+
+
+@dataclass
+class GuildWords:
+    """Word counts of one guild, the same size however much is said.
+
+    The sketch counts "author word" keys, with author 0 counting the word
+    for the whole guild.
+    """
+
+    sketch: CountMinSketch = field(
+        default_factory=lambda: CountMinSketch(WORDS_SKETCH_DEPTH, WORDS_SKETCH_WIDTH)
+    )
+    top: TopK = field(default_factory=lambda: TopK(WORDS_TOP_K))
+    authors: dict[int, AuthorWords] = field(default_factory=dict)
+    # authors changed since the last flush, GUILD for the guild itself
+    dirty: set[int] = field(default_factory=set)
+
+    def add(self, author_id: int, words: Sequence[str]):
+        author = self.authors.get(author_id)
+        if author is None:
+            author = self.authors[author_id] = AuthorWords()
+        for word in words:
+            self.top.offer(word, self.sketch.add(f"{GUILD} {word}"))
+            author.top.offer(word, self.sketch.add(f"{author_id} {word}"))
+            author.vocabulary.add(word)
+        author.total += len(words)
+        self.dirty.update((GUILD, author_id))
+
+
+class WordStats(BotCog):
+    """Most used words and vocabulary sizes, counted in fixed memory.
+
+    Messages are tokenized once by the profanity cog, which hands the
+    normalized words over in a message_words event. Counts are kept in
+    memory and flushed to the database every WORDS_FLUSH_INTERVAL seconds,
+    so a crash loses at most that much. Edits and deletes aren't counted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.guilds: dict[int, GuildWords] = {}
+
+    async def cog_load(self):
+        await self.bot.db.executescript(SCHEMA_WORDS)
+        await self.bot.db.commit()
+        await self.load()
+        self.flush.start()
+
+    async def cog_unload(self):
+        self.flush.cancel()
+        await self.try_save()
+
+    async def load(self):
+        conn = self.bot.db
+        async with conn.execute_fetchall(
+            "SELECT guild_id, counts FROM word_sketch"
+        ) as rows:
+            for guild_id, counts in rows:
+                sketch = CountMinSketch(WORDS_SKETCH_DEPTH, WORDS_SKETCH_WIDTH, counts)
+                self.guilds[guild_id] = GuildWords(sketch=sketch)
+        async with conn.execute_fetchall(
+            "SELECT guild_id, author_id, total, vocabulary FROM word_authors"
+        ) as rows:
+            for guild_id, author_id, total, vocabulary in rows:
+                self.get_guild(guild_id).authors[author_id] = AuthorWords(
+                    vocabulary=DistinctCounter.from_bytes(
+                        WORDS_VOCABULARY_K, vocabulary
+                    ),
+                    total=total,
+                )
+        async with conn.execute_fetchall(
+            "SELECT guild_id, author_id, word, count FROM word_top"
+        ) as rows:
+            for guild_id, author_id, word, count in rows:
+                guild = self.get_guild(guild_id)
+                if author_id == GUILD:
+                    guild.top.offer(word, count)
+                elif author_id in guild.authors:
+                    guild.authors[author_id].top.offer(word, count)
+        log.info("Loaded word counts for %d guilds", len(self.guilds))
+
+    async def save(self):
+        """Write out every guild and author changed since the last save.
+
+        If writing fails they stay marked as changed for the next save.
+        """
+        conn = self.bot.db
+        taken = []
+        try:
+            await self.write(conn, taken)
+        except BaseException:
+            for guild, dirty in taken:
+                guild.dirty |= dirty
+            raise
+
+    async def write(self, conn, taken: list[tuple[GuildWords, set[int]]]):
+        # messages from new guilds can come in while this waits on the database
+        for guild_id, guild in tuple(self.guilds.items()):
+            if not guild.dirty:
+                continue
+            dirty, guild.dirty = guild.dirty, set()
+            taken.append((guild, dirty))
+            await conn.execute(
+                "INSERT OR REPLACE INTO word_sketch (guild_id, counts) VALUES (?, ?)",
+                (guild_id, guild.sketch.to_bytes()),
+            )
+            top_rows = []
+            author_rows = []
+            for author_id in dirty:
+                if author_id == GUILD:
+                    top = guild.top
+                else:
+                    author = guild.authors[author_id]
+                    top = author.top
+                    author_rows.append(
+                        (
+                            guild_id,
+                            author_id,
+                            author.total,
+                            author.vocabulary.to_bytes(),
+                        )
+                    )
+                top_rows.extend(
+                    (guild_id, author_id, w, c) for w, c in top.counts.items()
+                )
+            await conn.executemany(
+                "DELETE FROM word_top WHERE guild_id=? AND author_id=?",
+                ((guild_id, a) for a in dirty),
+            )
+            await conn.executemany(
+                "INSERT INTO word_top (guild_id, author_id, word, count)"
+                " VALUES (?, ?, ?, ?)",
+                top_rows,
+            )
+            await conn.executemany(
+                "INSERT OR REPLACE INTO word_authors"
+                " (guild_id, author_id, total, vocabulary) VALUES (?, ?, ?, ?)",
+                author_rows,
+            )
+        await conn.commit()
+
+    async def try_save(self):
+        try:
+            await self.save()
+        except Exception:
+            log.exception("Could not save word counts")
+
+    @tasks.loop(seconds=WORDS_FLUSH_INTERVAL)
+    async def flush(self):
+        # a failed save mustn't stop the loop
+        await self.try_save()
+
+    def get_guild(self, guild_id: int) -> GuildWords:
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guild = self.guilds[guild_id] = GuildWords()
+        return guild
+
+    @commands.Cog.listener()
+    async def on_message_words(self, message: Message, words: Sequence[str]):
+        if message.guild is None or message.author.bot or not words:
+            return
+        self.get_guild(message.guild.id).add(message.author.id, words)
+
+    def random_word(self, guild_id: int) -> Optional[str]:
+        """A word said in the guild, the more common the likelier."""
+        guild = self.guilds.get(guild_id)
+        if guild is None or not guild.top.counts:
+            return None
+        words, counts = zip(*guild.top.counts.items())
+        return random.choices(words, weights=counts)[0]
+
+    @commands.hybrid_command(aliases=("words", "mostused"))
+    @commands.guild_only()
+    async def most_used_words(
+        self, ctx: Context, person: Optional[Member], rows: Optional[int]
+    ):
+        """the words people here say the most"""
+        guild = self.get_guild(ctx.guild.id)
+        rows = WORDS_ROWS_DEFAULT if rows is None else max(1, min(rows, WORDS_ROWS_MAX))
+        embed = discord.Embed()
+        if person is not None:
+            embed.set_author(name=person.name, icon_url=person.display_avatar.url)
+            author = guild.authors.get(person.id)
+            top = author.top if author is not None else TopK(0)
+        else:
+            icon_url = ctx.guild.icon.url if ctx.guild.icon is not None else None
+            embed.set_author(name=ctx.guild.name, icon_url=icon_url)
+            top = guild.top
+        # counts from the sketch can be a little high, never low
+        for word, count in top.most_common(rows):
+            embed.add_field(name=f"~{count}", value=word, inline=False)
+        if not embed.fields:
+            embed.description = "No words yet."
+        await ctx.send(embed=embed, allowed_mentions=MENTION_NONE)
+
+    @commands.hybrid_command(aliases=("vocab",))
+    @commands.guild_only()
+    async def vocabulary(self, ctx: Context, person: Optional[Member]):
+        """how many different words someone uses"""
+        person = person or ctx.author
+        author = self.get_guild(ctx.guild.id).authors.get(person.id)
+        if author is None:
+            await ctx.send(f"{person.mention} hasn't said anything yet.")
+            return
+        await ctx.send(
+            f"{person.mention} has used about {author.vocabulary.estimate()}"
+            f" different words in {author.total} words.",
+            allowed_mentions=MENTION_NONE,
+        )
@@ -9,13 +9,16 @@ INTENTS.members = True
 INTENTS.message_content = True
 
 # bot features
-ENABLE_BIRTHDAY = True
 ENABLE_CLOCK = True
-ENABLE_FISH = True
+ENABLE_EVENTS = True
 ENABLE_PROFANITY = True
+# word counts come from the profanity cog's tokenizing, so this needs it too
+ENABLE_WORDS = True
 ENABLE_READY_MESSAGE = True
 ENABLE_WELCOME = True
 ENABLE_SLASH_COMMANDS = True
+# samples the stack whenever the event loop is blocked, see cmpcstatus.watchdog
+ENABLE_WATCHDOG = False
 
 TESTING = False
 
@@ -24,20 +27,15 @@ FONT_SIZE_WELCOME = 40
 # file locations
 PATH_CONFIG = "config.toml"
 PATH_DATABASE = "db.sqlite3"
+PATH_EVENTS = "events.toml"
+PATH_PROFANITY_MODEL = "profanity.npz"
 
 # discord guild, role, and channel IDs
 GUILD_EGGYBOI = 714154158969716780
 ROLE_DEVELOPER = 741317598452645949
-ROLE_FISH = 875359516131209256
 ROLE_MEMBER = 932977796492427276
 ROLE_MODS = 725356663850270821
 
-USER_MARCEL = 416525692772286464
-USER_JMCB = 329885271787307008
-
-TEXT_CHANNEL_FISH = 875297517351358474
-# TEXT_CHANNEL_BIRTHDAY = 982687737503182858
-TEXT_CHANNEL_BIRTHDAY = TEXT_CHANNEL_FISH
 TEXT_CHANNEL_GENERAL = 714154159590473801
 TEXT_CHANNEL_BOT_COMMANDS = 736664393630220289
 VOICE_CHANNEL_CLOCK = 753467367966638100
@@ -53,7 +51,6 @@ COLOUR_RED = discord.Color.red()
 COLOUR_BLUE = discord.Color.blue()
 
 # discord emote objects
-EMOJI_BIBI_PARTY = discord.PartialEmoji.from_str("<:bibi_party:857659475687374898>")
 EMOJI_SAT_CAT = discord.PartialEmoji.from_str("<:sad_cat:770191103310823426>")
 EMOJI_SKULL = discord.PartialEmoji.from_str("💀")
 
@@ -69,27 +66,105 @@ CLOCK_TIMES = [
     for h in range(24)
 ]
 
-TIME_MIDNIGHT = datetime.time(hour=0, tzinfo=TZ_AMSTERDAM)
-TIME_FIVE_PAST_MIDNIGHT = datetime.time(hour=0, minute=5, tzinfo=TZ_AMSTERDAM)
-TIME_FGW_START = TIME_MIDNIGHT
-TIME_FGW_LOCK = TIME_MIDNIGHT
-TIME_FGW_END = TIME_FIVE_PAST_MIDNIGHT
-TIME_BDAY_START = TIME_MIDNIGHT
-TIME_BDAY_LOCK = TIME_MIDNIGHT
-TIME_BDAY_END = TIME_FIVE_PAST_MIDNIGHT
-
-DATE_BIRTHDAY_MONTH = 6
-DATE_BIRTHDAY_DAY = 5
-ISO_WEEKDAY_WEDNESDAY = 3
-ISO_WEEKDAY_THURSDAY = 4
+# event definitions are in PATH_EVENTS, checked for changes this often
+EVENTS_POLL_INTERVAL = 60
 # how many seconds in a minute
 COUNTDOWN_MINUTE = 60
+# how many minutes between locking and hiding an event channel
+COUNTDOWN_MINUTES = 5
+
+# refresh uploaded asset urls that expire within this many seconds
+UPLOAD_EXPIRY_MARGIN = 60 * 60
 
 # profanity config
 PROFANITY_INTERCEPT = (":3",)
 PROFANITY_ROWS_DEFAULT = 5
 PROFANITY_ROWS_MAX = 100
 PROFANITY_ROWS_INLINE = False
+# tokens whose normalized form and verdict are remembered
+PROFANITY_CACHE_SIZE = 65_536
+# linear classifier, hashed feature count and character n-gram lengths
+PROFANITY_MODEL_FEATURES = 2**18
+PROFANITY_MODEL_NGRAMS = (2, 4)
+# one in this many words is held out of training to measure the model on
+PROFANITY_MODEL_HOLDOUT = 5
+
+# rows per chunk when exporting or importing the database
+DATABASE_CHUNK_ROWS = 10_000
+# how long a writer waits for another process to release the database
+DATABASE_BUSY_TIMEOUT_MS = 5_000
+
+# shard launcher
+LAUNCHER_METRICS_INTERVAL = 60
+LAUNCHER_RESTART_BACKOFF_MAX = 300
+# a cluster that stayed up this long gets its restart backoff reset
+LAUNCHER_STABLE_SECONDS = 600
+# how long a stopped cluster gets to shut down before it is killed
+LAUNCHER_STOP_TIMEOUT = 60
+
+# seconds before git and other programs are killed
+SUBPROCESS_TIMEOUT = 30
+
+# logging, one JSON object per line unless LOG_JSON is off
+LOG_JSON = True
+LOG_LEVEL = "INFO"
+# keep 1 in n records below WARNING from loggers that speak for every
+# message or request, child loggers included
+LOG_SAMPLING = {
+    "discord.gateway": 10,
+    "discord.http": 10,
+}
+
+# members kept by MemberCache, and asked for per gateway request (at most 100)
+MEMBER_CACHE_SIZE = 10_000
+MEMBER_QUERY_BATCH = 100
+
+# word counts, sketch size per guild, words remembered per guild and per
+# author, and hashes kept per author to estimate their vocabulary
+WORDS_SKETCH_DEPTH = 4
+WORDS_SKETCH_WIDTH = 2**16
+WORDS_TOP_K = 500
+WORDS_AUTHOR_TOP_K = 25
+WORDS_VOCABULARY_K = 128
+WORDS_ROWS_DEFAULT = 10
+# discord allows 25 fields per embed
+WORDS_ROWS_MAX = 25
+WORDS_FLUSH_INTERVAL = 5 * 60
+
+# quints ledger, shortest digit run recorded and how its writes are batched
+QUINTS_MIN_DIGITS = 5
+QUINTS_BATCH_ROWS = 500
+QUINTS_FLUSH_DELAY = 10
+QUINTS_ROWS_DEFAULT = 10
+QUINTS_ROWS_MAX = 25
+
+# seconds shutdown waits for running event handlers and cog work
+SHUTDOWN_TIMEOUT = 10
+
+# event loop watchdog, seconds between heartbeats and how late one may be
+# before the loop counts as blocked, frames kept per stack and stacks kept
+WATCHDOG_INTERVAL = 0.05
+WATCHDOG_THRESHOLD = 0.25
+WATCHDOG_STACK_DEPTH = 40
+WATCHDOG_OFFENDERS = 50
+
+# random games resolved ahead of time, and how long to wait on an empty
+# buffer before resolving one directly
+RANDOM_GAME_BUFFER = 5
+RANDOM_GAME_TIMEOUT = 3
+
+# history scans, messages per batch and batches fetched ahead of the consumers
+SCAN_BATCH_SIZE = 100
+SCAN_QUEUE_BATCHES = 4
+
+# command rate limits: {command: {"user" or "channel": (uses, per seconds)}}
+RATE_LIMITS = {
+    "capybara": {"user": (3, 30), "channel": (10, 60)},
+    "cat": {"user": (3, 30), "channel": (10, 60)},
+    "gif": {"user": (5, 30), "channel": (15, 60)},
+    "httpcat": {"user": (3, 30), "channel": (10, 60)},
+    "animal": {"user": (2, 60), "channel": (5, 60)},
+}
 
 # bot command prefices
 COMMAND_PREFIX = [
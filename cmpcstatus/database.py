@@ -0,0 +1,90 @@
+from typing import Optional
+
+import aiosqlite
+
+from cmpcstatus.constants import DATABASE_BUSY_TIMEOUT_MS, GUILD_EGGYBOI, PATH_DATABASE
+
+SCHEMA_LB = """
+CREATE TABLE IF NOT EXISTS lb (
+    message_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    author_id INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL,
+    PRIMARY KEY (message_id, position)
+);
+"""
+
+# small bits of bot state that should survive restarts
+SCHEMA_STATE = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# every leaderboard query is scoped to a guild
+INDEXES_LB = """
+CREATE INDEX IF NOT EXISTS lb_guild_word ON lb (guild_id, word, author_id);
+CREATE INDEX IF NOT EXISTS lb_guild_author ON lb (guild_id, author_id, word);
+"""
+
+
+async def migrate_lb(conn: aiosqlite.Connection):
+    # databases from before multi-guild support only held the one guild
+    async with conn.execute_fetchall("PRAGMA table_info(lb)") as rows:
+        columns = {r[1] for r in rows}
+    if "guild_id" not in columns:
+        await conn.execute(
+            "ALTER TABLE lb ADD COLUMN guild_id INTEGER NOT NULL"
+            f" DEFAULT {GUILD_EGGYBOI:d}"
+        )
+
+
+async def normalize_lb_words(conn: aiosqlite.Connection):
+    # rows from before normalization hold words as they were written,
+    # which split counts with the normalized rows and make edits rescore
+    if await get_state(conn, "lb:normalized") is not None:
+        return
+    # cogs.profanity imports this module
+    from cmpcstatus.cogs.profanity import normalize_word
+
+    async with conn.execute_fetchall("SELECT DISTINCT word FROM lb") as rows:
+        words = [r[0] for r in rows]
+    renamed = [(normalize_word(w), w) for w in words]
+    await conn.executemany(
+        "UPDATE lb SET word=? WHERE word=?",
+        [(new, old) for new, old in renamed if new and new != old],
+    )
+    await set_state(conn, "lb:normalized", "1")
+
+
+async def connect(path: str = PATH_DATABASE) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(path)
+    # shard processes each hold their own connection to the same file,
+    # WAL lets them write without blocking readers and busy_timeout queues writers
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute(f"PRAGMA busy_timeout={DATABASE_BUSY_TIMEOUT_MS:d}")
+    await conn.executescript(SCHEMA_LB)
+    await migrate_lb(conn)
+    await conn.executescript(INDEXES_LB)
+    await conn.executescript(SCHEMA_STATE)
+    await normalize_lb_words(conn)
+    await conn.commit()
+    return conn
+
+
+async def get_state(conn: aiosqlite.Connection, key: str) -> Optional[str]:
+    async with conn.execute_fetchall(
+        "SELECT value FROM state WHERE key=:key", {"key": key}
+    ) as rows:
+        return rows[0][0] if rows else None
+
+
+async def set_state(conn: aiosqlite.Connection, key: str, value: str):
+    await conn.execute(
+        "INSERT OR REPLACE INTO state (key, value) VALUES (:key, :value)",
+        {"key": key, "value": value},
+    )
+    await conn.commit()
@@ -0,0 +1,155 @@
+"""Columnar dump of the profanity leaderboard.
+
+Usage: python -m cmpcstatus.export {export,import} FILE [--database PATH]
+
+The file is a magic header followed by chunks of up to DATABASE_CHUNK_ROWS
+rows. Each chunk stores its row count, then every column of the lb table
+as its own zlib stream: integers and floats as packed 8 byte arrays,
+words as NUL separated utf-8. A chunk with zero rows ends the file.
+
+Export walks the table in rowid order with fetchmany, so memory stays at
+one chunk. Import inserts a whole chunk per executemany (sqlite caches the
+prepared INSERT) and commits once per chunk. Aim for >= 100k rows/sec
+either way; both directions log the rate they achieved.
+"""
+
+import argparse
+import asyncio
+import logging
+import struct
+import sys
+import time
+import zlib
+from array import array
+from typing import BinaryIO, Iterable, Sequence
+
+import aiosqlite
+
+from cmpcstatus.constants import DATABASE_CHUNK_ROWS, PATH_DATABASE
+from cmpcstatus.database import connect
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"CMPCLB\x00\x02"
+# (name, array typecode or None for text)
+COLUMNS = (
+    ("message_id", "q"),
+    ("created_at", "d"),
+    ("author_id", "q"),
+    ("word", None),
+    ("position", "q"),
+    ("guild_id", "q"),
+)
+LENGTH = struct.Struct("<I")
+
+
+def encode_column(values: Sequence, typecode: str | None) -> bytes:
+    if typecode is None:
+        raw = "\0".join(values).encode("utf-8")
+    else:
+        a = array(typecode, values)
+        if sys.byteorder == "big":
+            a.byteswap()
+        raw = a.tobytes()
+    return zlib.compress(raw)
+
+
+def decode_column(data: bytes, typecode: str | None, rows: int) -> list:
+    raw = zlib.decompress(data)
+    if typecode is None:
+        return raw.decode("utf-8").split("\0") if rows else []
+    a = array(typecode)
+    a.frombytes(raw)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tolist()
+
+
+def write_chunk(fp: BinaryIO, rows: Sequence[tuple]):
+    fp.write(LENGTH.pack(len(rows)))
+    if not rows:
+        return
+    columns = zip(*rows)
+    for (_, typecode), values in zip(COLUMNS, columns):
+        data = encode_column(values, typecode)
+        fp.write(LENGTH.pack(len(data)))
+        fp.write(data)
+
+
+def read_chunks(fp: BinaryIO) -> Iterable[list[tuple]]:
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a leaderboard export")
+    while True:
+        (rows,) = LENGTH.unpack(fp.read(LENGTH.size))
+        if rows == 0:
+            return
+        columns = []
+        for _, typecode in COLUMNS:
+            (length,) = LENGTH.unpack(fp.read(LENGTH.size))
+            columns.append(decode_column(fp.read(length), typecode, rows))
+        yield list(zip(*columns))
+
+
+async def export_lb(
+    conn: aiosqlite.Connection, fp: BinaryIO, chunk_rows: int = DATABASE_CHUNK_ROWS
+) -> int:
+    """Write the lb table to fp, return the number of rows written."""
+    names = ", ".join(name for name, _ in COLUMNS)
+    start = time.perf_counter()
+    total = 0
+    fp.write(MAGIC)
+    async with conn.execute(f"SELECT {names} FROM lb ORDER BY rowid") as cursor:
+        while rows := await cursor.fetchmany(chunk_rows):
+            write_chunk(fp, rows)
+            total += len(rows)
+    write_chunk(fp, ())
+    elapsed = time.perf_counter() - start
+    log.info("Exported %d rows (%.0f rows/sec)", total, total / max(elapsed, 1e-9))
+    return total
+
+
+async def import_lb(conn: aiosqlite.Connection, fp: BinaryIO) -> int:
+    """Insert rows from fp into the lb table, return the number of rows read.
+
+    Rows that already exist are skipped.
+    """
+    names = ", ".join(name for name, _ in COLUMNS)
+    params = ", ".join("?" for _ in COLUMNS)
+    query = f"INSERT OR IGNORE INTO lb ({names}) VALUES ({params})"
+    start = time.perf_counter()
+    total = 0
+    for rows in read_chunks(fp):
+        await conn.executemany(query, rows)
+        await conn.commit()
+        total += len(rows)
+    elapsed = time.perf_counter() - start
+    log.info("Imported %d rows (%.0f rows/sec)", total, total / max(elapsed, 1e-9))
+    return total
+
+
+async def run(action: str, file: str, database: str):
+    conn = await connect(database)
+    try:
+        if action == "export":
+            with open(file, "wb") as fp:
+                await export_lb(conn, fp)
+        else:
+            with open(file, "rb") as fp:
+                await import_lb(conn, fp)
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m cmpcstatus.export")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("file")
+    parser.add_argument("--database", default=PATH_DATABASE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.action, args.file, args.database))
+
+
+if __name__ == "__main__":
+    main()
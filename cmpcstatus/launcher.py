@@ -0,0 +1,218 @@
+"""Run the bot's shards as several supervised processes.
+
+Usage: python -m cmpcstatus.launcher
+
+The shards are split evenly over the `clusters` configured in config.toml.
+Every cluster is its own process with its own database connection, crashed
+or exited clusters are started again with an exponential backoff, and each
+cluster reports its metrics back to the launcher over a queue.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from typing import Optional
+
+import aiohttp
+from discord.ext import tasks
+
+from cmpcstatus import create_bot
+from cmpcstatus.bot import BotConfig, load_config
+from cmpcstatus.cogs import BotCog
+from cmpcstatus.constants import (
+    LAUNCHER_METRICS_INTERVAL,
+    LAUNCHER_RESTART_BACKOFF_MAX,
+    LAUNCHER_STABLE_SECONDS,
+    LAUNCHER_STOP_TIMEOUT,
+)
+from cmpcstatus.logs import setup_logging
+
+log = logging.getLogger(__name__)
+
+
+class ClusterMetrics(BotCog):
+    def __init__(self, *args, cluster: int, metrics: multiprocessing.Queue, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cluster = cluster
+        self.metrics = metrics
+
+    async def cog_load(self):
+        self.report.start()
+
+    async def cog_unload(self):
+        self.report.cancel()
+
+    @tasks.loop(seconds=LAUNCHER_METRICS_INTERVAL)
+    async def report(self):
+        self.metrics.put(
+            {
+                "cluster": self.cluster,
+                "shards": len(self.bot.shards),
+                "guilds": len(self.bot.guilds),
+                "members": sum(g.member_count or 0 for g in self.bot.guilds),
+                "latency": self.bot.latency,
+                "rate_limited": sum(self.bot.rate_limiter.rejected.values()),
+            }
+        )
+
+    @report.before_loop
+    async def before_report(self):
+        await self.bot.wait_until_ready()
+
+
+def run_cluster(
+    cluster: int,
+    shard_ids: list[int],
+    shard_count: int,
+    metrics: multiprocessing.Queue,
+):
+    """Process entry point for a single cluster."""
+    listener = setup_logging()
+    bot = create_bot(shard_ids=shard_ids, shard_count=shard_count)
+
+    async def runner():
+        async with bot:
+            await bot.add_cog(ClusterMetrics(bot, cluster=cluster, metrics=metrics))
+            await bot.start(bot.config.discord_token)
+
+    try:
+        asyncio.run(runner())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+
+
+async def recommended_shards(token: str) -> int:
+    url = "https://discord.com/api/v10/gateway/bot"
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data["shards"]
+
+
+def split_shards(shard_count: int, clusters: int) -> list[list[int]]:
+    clusters = max(1, min(clusters, shard_count))
+    return [list(range(shard_count))[i::clusters] for i in range(clusters)]
+
+
+@dataclass
+class Cluster:
+    index: int
+    shard_ids: list[int]
+    process: Optional[BaseProcess] = None
+    started: float = 0.0
+    restarts: int = 0
+    backoff: float = 1.0
+    restart_at: float = 0.0
+    metrics: dict = field(default_factory=dict)
+
+
+class Launcher:
+    def __init__(self, config: BotConfig, shard_count: int):
+        self.config = config
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context("spawn")
+        self.metrics = self.context.Queue()
+        self.clusters = [
+            Cluster(index=i, shard_ids=s)
+            for i, s in enumerate(split_shards(shard_count, config.clusters))
+        ]
+        self.running = True
+
+    def start(self, cluster: Cluster):
+        log.info("Starting cluster %d with shards %s", cluster.index, cluster.shard_ids)
+        cluster.process = self.context.Process(
+            target=run_cluster,
+            args=(cluster.index, cluster.shard_ids, self.shard_count, self.metrics),
+            name=f"cluster-{cluster.index}",
+        )
+        cluster.process.start()
+        cluster.started = time.monotonic()
+
+    def check(self, cluster: Cluster):
+        """Restart the cluster if its process has exited."""
+        now = time.monotonic()
+        process = cluster.process
+        if process is not None and process.is_alive():
+            return
+        if process is not None:
+            log.warning(
+                "Cluster %d exited with code %s", cluster.index, process.exitcode
+            )
+            if now - cluster.started > LAUNCHER_STABLE_SECONDS:
+                cluster.backoff = 1.0
+            cluster.restart_at = now + cluster.backoff
+            cluster.backoff = min(cluster.backoff * 2, LAUNCHER_RESTART_BACKOFF_MAX)
+            cluster.restarts += 1
+            cluster.process = None
+        if now >= cluster.restart_at:
+            self.start(cluster)
+
+    def collect(self):
+        while True:
+            try:
+                m = self.metrics.get_nowait()
+            except queue.Empty:
+                return
+            self.clusters[m["cluster"]].metrics = m
+
+    def report(self):
+        for c in self.clusters:
+            log.info(
+                "cluster %d: restarts %d, %s", c.index, c.restarts, c.metrics or "-"
+            )
+
+    def run(self):
+        last_report = time.monotonic()
+        try:
+            while self.running:
+                for c in self.clusters:
+                    self.check(c)
+                self.collect()
+                if time.monotonic() - last_report >= LAUNCHER_METRICS_INTERVAL:
+                    self.report()
+                    last_report = time.monotonic()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            log.info("Stopping clusters")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        # clusters close gracefully on SIGTERM, see Bot.setup_hook
+        for c in self.clusters:
+            if c.process is not None and c.process.is_alive():
+                c.process.terminate()
+        deadline = time.monotonic() + LAUNCHER_STOP_TIMEOUT
+        for c in self.clusters:
+            if c.process is None:
+                continue
+            c.process.join(max(0.0, deadline - time.monotonic()))
+            if c.process.is_alive():
+                log.warning("Cluster %d didn't stop, killing it", c.index)
+                c.process.kill()
+                c.process.join()
+
+
+def main():
+    listener = setup_logging()
+    config = load_config()
+    shard_count = config.shard_count
+    if shard_count is None:
+        shard_count = asyncio.run(recommended_shards(config.discord_token))
+    try:
+        Launcher(config, shard_count).run()
+    finally:
+        listener.stop()
+
+
+if __name__ == "__main__":
+    main()
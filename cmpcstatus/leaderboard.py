@@ -0,0 +1,82 @@
+import json
+from typing import Iterable, Literal, Optional
+
+import aiosqlite
+
+Column = Literal["word", "author_id"]
+
+# Every query is a fixed string, so sqlite's statement cache prepares each
+# one once per connection and reuses it for every later call.
+
+
+def _top(group: Column, where: str) -> str:
+    # the window sum runs before LIMIT, so it is the total of every group
+    return f"""
+        SELECT {group}, COUNT(*) AS num, SUM(COUNT(*)) OVER () AS total FROM lb
+        WHERE guild_id=:guild_id {where}
+        GROUP BY {group} ORDER BY num DESC
+        LIMIT :rows;
+        """
+
+
+def _totals(column: Column) -> str:
+    # the ids/words go in as one json array so the text stays the same
+    return f"""
+        SELECT {column}, COUNT(*) FROM lb
+        WHERE guild_id=:guild_id AND {column} IN (SELECT value FROM json_each(:keys))
+        GROUP BY {column};
+        """
+
+
+TOP_QUERIES = {
+    ("word", None): _top("word", ""),
+    ("word", "author_id"): _top("word", "AND author_id=:author_id"),
+    ("author_id", None): _top("author_id", ""),
+    ("author_id", "word"): _top("author_id", "AND word=:word"),
+}
+TOTALS_QUERIES = {c: _totals(c) for c in ("word", "author_id")}
+
+
+class Leaderboard:
+    """Read queries on the lb table."""
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self.conn = conn
+
+    async def top(
+        self,
+        guild_id: int,
+        group: Column,
+        rows: int,
+        author_id: Optional[int] = None,
+        word: Optional[str] = None,
+    ) -> tuple[list[tuple], int]:
+        """The most common words (or authors) and the total over all of them.
+
+        Filter by at most one of author_id or word.
+        """
+        if author_id is not None:
+            where = "author_id"
+        elif word is not None:
+            where = "word"
+        else:
+            where = None
+        query = TOP_QUERIES[group, where]
+        arg = {
+            "guild_id": guild_id,
+            "rows": rows,
+            "author_id": author_id,
+            "word": word,
+        }
+        async with self.conn.execute_fetchall(query, arg) as result:
+            total = result[0][2] if result else 0
+            return [(key, count) for key, count, _ in result], total
+
+    async def totals(self, guild_id: int, column: Column, keys: Iterable) -> dict:
+        """Swear counts for many authors or words in one query.
+
+        Keys without any swears are left out.
+        """
+        arg = {"guild_id": guild_id, "keys": json.dumps(list(keys))}
+        async with self.conn.execute_fetchall(TOTALS_QUERIES[column], arg) as rows:
+            return dict(rows)
@@ -0,0 +1,126 @@
+"""Logging that never writes from the event loop.
+
+Records are put on a queue by a QueueHandler and written out by a
+QueueListener thread, as JSON lines or plain text.
+"""
+
+import datetime
+import logging
+import logging.handlers
+import queue
+import sys
+from collections import Counter
+from typing import Mapping, Optional
+
+import orjson
+
+from cmpcstatus.constants import LOG_JSON, LOG_LEVEL, LOG_SAMPLING
+
+# remove fancy ass shell colour that looks dumb in dark theme
+PLAIN_FORMATTER = logging.Formatter(logging.BASIC_FORMAT)
+
+# anything else on a record came from extra={...}
+RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        for k, v in vars(record).items():
+            if k not in RECORD_ATTRS:
+                entry[k] = v
+        return orjson.dumps(entry, default=str).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """Keep 1 in n records below WARNING from noisy loggers.
+
+    A rate set for a logger also covers its children.
+    """
+
+    def __init__(self, rates: Mapping[str, int]):
+        super().__init__()
+        self.rates = rates
+        self.resolved: dict[str, int] = {}
+        self.seen: Counter[str] = Counter()
+        self.dropped: Counter[str] = Counter()
+
+    def rate(self, name: str) -> int:
+        rate = self.resolved.get(name)
+        if rate is None:
+            rate = 1
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self.resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        if rate <= 1:
+            return True
+        self.seen[record.name] += 1
+        if self.seen[record.name] % rate == 1:
+            return True
+        self.dropped[record.name] += 1
+        return False
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # merge the arguments here, they may change before the listener runs,
+        # but leave the traceback for the listener's formatter
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = PLAIN_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    json: bool = LOG_JSON,
+    sampling: Optional[Mapping[str, int]] = None,
+) -> logging.handlers.QueueListener:
+    """Send every log record through a queue to a writer thread.
+
+    Returns the started listener, stop it on exit to flush what is left.
+    """
+    if sampling is None:
+        sampling = LOG_SAMPLING
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if json else PLAIN_FORMATTER)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LoopQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    return listener
@@ -0,0 +1,111 @@
+"""Member lookups that don't need every member of every guild in memory."""
+
+import logging
+from collections import OrderedDict
+from typing import Iterable, Literal, Optional
+
+import discord
+from discord import Guild, Member
+
+from cmpcstatus.constants import INTENTS, MEMBER_CACHE_SIZE, MEMBER_QUERY_BATCH
+
+log = logging.getLogger(__name__)
+
+# "all" chunks every guild at startup and keeps every member, like discord.py
+# does by default. "recent" keeps no members in discord.py's cache, only the
+# MEMBER_CACHE_SIZE most recently seen or looked up ones in a MemberCache.
+MemberCachePolicy = Literal["all", "recent"]
+
+
+def member_cache_options(policy: MemberCachePolicy) -> dict:
+    """Client keyword arguments for a member cache policy."""
+    if policy == "all":
+        return {
+            "member_cache_flags": discord.MemberCacheFlags.from_intents(INTENTS),
+            "chunk_guilds_at_startup": True,
+        }
+    if policy == "recent":
+        # the bot's own member is always kept
+        return {
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False,
+        }
+    raise ValueError(f"Unknown member cache policy: {policy}")
+
+
+class MemberCache:
+    """A bounded LRU of members in front of discord.py's member cache.
+
+    Members are remembered when they are seen or looked up, and the least
+    recently used ones are forgotten past `size`. IDs that turned out not to
+    be in the guild are remembered as None, so they aren't asked for again.
+    """
+
+    def __init__(self, size: int = MEMBER_CACHE_SIZE):
+        self.size = size
+        self.members: OrderedDict[tuple[int, int], Optional[Member]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def remember(self, guild_id: int, member_id: int, member: Optional[Member]):
+        key = (guild_id, member_id)
+        self.members[key] = member
+        self.members.move_to_end(key)
+        if len(self.members) > self.size:
+            self.members.popitem(last=False)
+
+    def seen(self, member: Member):
+        self.remember(member.guild.id, member.id, member)
+
+    def left(self, guild_id: int, member_id: int):
+        self.remember(guild_id, member_id, None)
+
+    def get(self, guild: Guild, member_id: int) -> tuple[bool, Optional[Member]]:
+        """Return whether the answer is known, and the member if it is one."""
+        member = guild.get_member(member_id)
+        if member is not None:
+            return True, member
+        key = (guild.id, member_id)
+        if key not in self.members:
+            return False, None
+        self.members.move_to_end(key)
+        return True, self.members[key]
+
+    async def resolve(
+        self, guild: Guild, member_ids: Iterable[int], remember: bool = True
+    ) -> dict[int, Member]:
+        """Look up many members at once, IDs not in the guild are left out.
+
+        Unknown IDs are requested from the gateway MEMBER_QUERY_BATCH at a
+        time, unless the guild is chunked and discord.py already has them all.
+        One-off sweeps over many IDs, like trimming the leaderboard, should
+        pass remember=False so they don't push out everyone else.
+        """
+        found = {}
+        unknown = []
+        for member_id in member_ids:
+            known, member = self.get(guild, member_id)
+            if not known:
+                unknown.append(member_id)
+            elif member is not None:
+                found[member_id] = member
+        self.hits += len(found)
+        # everyone who is in a chunked guild is in guild.get_member
+        if guild.chunked:
+            return found
+        self.misses += len(unknown)
+
+        for start in range(0, len(unknown), MEMBER_QUERY_BATCH):
+            batch = unknown[start : start + MEMBER_QUERY_BATCH]
+            members = await guild.query_members(
+                user_ids=batch, limit=len(batch), cache=False
+            )
+            by_id = {m.id: m for m in members}
+            for member_id in batch:
+                member = by_id.get(member_id)
+                if member is not None:
+                    found[member_id] = member
+                if remember:
+                    self.remember(guild.id, member_id, member)
+        log.debug("Resolved %d members, %d queried", len(found), len(unknown))
+        return found
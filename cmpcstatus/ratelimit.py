@@ -0,0 +1,85 @@
+import time
+from collections import Counter
+from typing import Mapping, Optional
+
+from discord.ext import commands
+from discord.ext.commands import Context
+
+# (capacity, seconds to refill from empty)
+Limit = tuple[float, float]
+
+
+class RateLimited(commands.CheckFailure):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Slow down! Try again in {retry_after:.1f}s.")
+
+
+class RateLimiter:
+    """Token buckets per user and per channel for each limited command.
+
+    A bucket is only a (tokens, timestamp) pair and is refilled lazily when
+    it is next used. Buckets that have refilled completely are dropped
+    every `sweep_every` calls, so idle users cost nothing.
+    """
+
+    def __init__(
+        self, limits: Mapping[str, Mapping[str, Limit]], sweep_every: int = 1024
+    ):
+        self.limits = limits
+        self.sweep_every = sweep_every
+        self.calls = 0
+        self.buckets: dict[tuple[str, str, int], tuple[float, float]] = {}
+        self.allowed: Counter[str] = Counter()
+        self.rejected: Counter[str] = Counter()
+
+    def peek(self, key: tuple[str, str, int], limit: Limit, now: float) -> float:
+        capacity, per = limit
+        tokens, stamp = self.buckets.get(key, (capacity, now))
+        return min(capacity, tokens + (now - stamp) * capacity / per)
+
+    def acquire(
+        self, command: str, user_id: int, channel_id: int, now: Optional[float] = None
+    ) -> float:
+        """Take a token, return 0 or how many seconds until one is available."""
+        limits = self.limits.get(command)
+        if not limits:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        self.calls += 1
+        if self.calls % self.sweep_every == 0:
+            self.sweep(now)
+
+        ids = {"user": user_id, "channel": channel_id}
+        keys = [((command, s, ids[s]), limit) for s, limit in limits.items()]
+        levels = [self.peek(key, limit, now) for key, limit in keys]
+        # every bucket needs a token, otherwise none are taken
+        retry_after = max(
+            (1 - tokens) * limit[1] / limit[0]
+            for tokens, (_, limit) in zip(levels, keys)
+        )
+        if retry_after > 0:
+            self.rejected[command] += 1
+            return retry_after
+        for tokens, (key, _) in zip(levels, keys):
+            self.buckets[key] = (tokens - 1, now)
+        self.allowed[command] += 1
+        return 0.0
+
+    def sweep(self, now: float):
+        for key in tuple(self.buckets):
+            command, scope, _ = key
+            limit = self.limits[command][scope]
+            if self.peek(key, limit, now) >= limit[0]:
+                del self.buckets[key]
+
+    async def check(self, ctx: Context) -> bool:
+        if ctx.command is None:
+            return True
+        retry_after = self.acquire(
+            ctx.command.qualified_name, ctx.author.id, ctx.channel.id
+        )
+        if retry_after:
+            raise RateLimited(retry_after)
+        return True
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional, Sequence
+
+from discord import Message, TextChannel
+from discord.abc import Snowflake
+
+from cmpcstatus.constants import SCAN_BATCH_SIZE, SCAN_QUEUE_BATCHES
+
+log = logging.getLogger(__name__)
+
+
+class HistoryConsumer:
+    """Something that wants to see every message of a history scan.
+
+    Cogs offer one through a `make_history_consumer` method.
+    """
+
+    name: str
+
+    async def consume(self, messages: Sequence[Message]):
+        raise NotImplementedError
+
+    async def finish(self):
+        """Called once after the last batch."""
+
+    def summary(self) -> str:
+        raise NotImplementedError
+
+
+@dataclass
+class ScanProgress:
+    channel: TextChannel
+    messages: int = 0
+    batches: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    done: bool = False
+
+    @property
+    def rate(self) -> float:
+        return self.messages / max(time.perf_counter() - self.started, 1e-9)
+
+    def __str__(self) -> str:
+        state = "Scanned" if self.done else "Scanning"
+        return (
+            f"{state} {self.channel.mention}: {self.messages} messages"
+            f" ({self.rate:.0f}/s)"
+        )
+
+
+async def history_batches(
+    channel: TextChannel,
+    limit: Optional[int] = None,
+    around: Optional[Snowflake] = None,
+    batch_size: int = SCAN_BATCH_SIZE,
+) -> AsyncIterator[list[Message]]:
+    batch = []
+    async for message in channel.history(limit=limit, around=around):
+        batch.append(message)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class HistoryScanner:
+    """Reads channel history once and hands every batch to all consumers.
+
+    Fetching runs ahead of the consumers by at most SCAN_QUEUE_BATCHES
+    batches, so memory stays bounded however long the history is.
+    """
+
+    def __init__(
+        self,
+        consumers: Sequence[HistoryConsumer],
+        on_progress: Optional[Callable[[ScanProgress], Awaitable]] = None,
+        progress_every: int = 10,
+    ):
+        self.consumers = consumers
+        self.on_progress = on_progress
+        self.progress_every = progress_every
+
+    async def produce(self, queue: asyncio.Queue, channel: TextChannel, limit, around):
+        try:
+            async for batch in history_batches(channel, limit, around):
+                await queue.put(batch)
+        finally:
+            # scan() cancels this once it stops reading, e.g. when a consumer
+            # raised, and then a full queue would never take the end marker
+            if not asyncio.current_task().cancelling():
+                await queue.put(None)
+
+    async def scan(
+        self,
+        channel: TextChannel,
+        limit: Optional[int] = None,
+        around: Optional[Snowflake] = None,
+    ) -> ScanProgress:
+        progress = ScanProgress(channel)
+        queue: asyncio.Queue[Optional[list[Message]]] = asyncio.Queue(
+            SCAN_QUEUE_BATCHES
+        )
+        producer = asyncio.create_task(self.produce(queue, channel, limit, around))
+        try:
+            while (batch := await queue.get()) is not None:
+                for c in self.consumers:
+                    await c.consume(batch)
+                progress.messages += len(batch)
+                progress.batches += 1
+                if self.on_progress and progress.batches % self.progress_every == 0:
+                    await self.on_progress(progress)
+            # raise any error from fetching
+            await producer
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+        progress.done = True
+        if self.on_progress:
+            await self.on_progress(progress)
+        log.info("%s", progress)
+        return progress
+
+    async def finish(self):
+        for c in self.consumers:
+            await c.finish()
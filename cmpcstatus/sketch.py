@@ -0,0 +1,121 @@
+"""Fixed size summaries of streams with an unbounded number of keys."""
+
+import hashlib
+import heapq
+from array import array
+from typing import Iterable, Optional
+
+
+def hash64(key: str) -> tuple[int, int]:
+    # stable across restarts, unlike hash()
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class CountMinSketch:
+    """Approximate counts in depth * width counters.
+
+    Estimates are never too low, and with conservative updates only
+    counters that are the current minimum are raised, which keeps the
+    overestimates from hash collisions small.
+    """
+
+    def __init__(self, depth: int, width: int, counts: Optional[bytes] = None):
+        self.depth = depth
+        self.width = width
+        self.counts = array("I")
+        if counts is None:
+            counts = bytes(depth * width * self.counts.itemsize)
+        self.counts.frombytes(counts)
+        if len(self.counts) != depth * width:
+            raise ValueError("sketch size doesn't match")
+
+    def indices(self, key: str) -> list[int]:
+        h1, h2 = hash64(key)
+        w = self.width
+        return [row * w + (h1 + row * h2) % w for row in range(self.depth)]
+
+    def add(self, key: str, n: int = 1) -> int:
+        """Count key n more times and return its new estimate."""
+        counts = self.counts
+        indices = self.indices(key)
+        estimate = min(counts[i] for i in indices) + n
+        for i in indices:
+            if counts[i] < estimate:
+                counts[i] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        counts = self.counts
+        return min(counts[i] for i in self.indices(key))
+
+    def to_bytes(self) -> bytes:
+        return self.counts.tobytes()
+
+
+class TopK:
+    """The k keys with the highest counts offered so far."""
+
+    def __init__(self, k: int, counts: Optional[dict[str, int]] = None):
+        self.k = k
+        self.counts: dict[str, int] = dict(counts or {})
+        self.floor = min(self.counts.values()) if len(self.counts) >= k else 0
+
+    def offer(self, key: str, count: int):
+        counts = self.counts
+        if key in counts:
+            counts[key] = count
+        elif len(counts) < self.k:
+            counts[key] = count
+        elif count > self.floor:
+            del counts[min(counts, key=counts.__getitem__)]
+            counts[key] = count
+        else:
+            # most keys are rare and end here
+            return
+        if len(counts) >= self.k:
+            self.floor = min(counts.values())
+
+    def most_common(self, n: Optional[int] = None) -> list[tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+
+class DistinctCounter:
+    """Estimates how many different keys were added, from the k smallest hashes.
+
+    Below k keys the count is exact.
+    """
+
+    def __init__(self, k: int, hashes: Iterable[int] = ()):
+        self.k = k
+        hashes = list(hashes)
+        # max heap of the k smallest hashes, as negatives
+        self.heap = [-h for h in hashes]
+        heapq.heapify(self.heap)
+        self.kept = set(hashes)
+
+    def add(self, key: str):
+        h = hash64(key)[0]
+        if h in self.kept:
+            return
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, -h)
+            self.kept.add(h)
+        elif h < -self.heap[0]:
+            self.kept.discard(-heapq.heapreplace(self.heap, -h))
+            self.kept.add(h)
+
+    def estimate(self) -> int:
+        if len(self.heap) < self.k:
+            return len(self.heap)
+        largest = -self.heap[0]
+        return round((self.k - 1) * 2**64 / largest)
+
+    def to_bytes(self) -> bytes:
+        return array("Q", self.kept).tobytes()
+
+    @classmethod
+    def from_bytes(cls, k: int, data: bytes) -> "DistinctCounter":
+        hashes = array("Q")
+        hashes.frombytes(data)
+        return cls(k, hashes)
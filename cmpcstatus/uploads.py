@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import time
+import urllib.parse
+from functools import cache
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import aiosqlite
+import discord
+from discord import Embed, Message
+from discord.abc import Messageable
+from discord.http import Route
+
+from cmpcstatus.constants import UPLOAD_EXPIRY_MARGIN
+from cmpcstatus.util import get_asset
+
+if TYPE_CHECKING:
+    from cmpcstatus.bot import Bot
+
+log = logging.getLogger(__name__)
+
+SCHEMA_UPLOADS = """
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256 TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+"""
+
+
+@cache
+def asset_hash(name: str) -> str:
+    with get_asset(name) as path:
+        with open(path, "rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """Unix time a signed discord CDN url stops working, if it is signed."""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    ex = query.get("ex")
+    if not ex:
+        return None
+    return int(ex[0], 16)
+
+
+class UploadCache:
+    """Remembers where assets were uploaded so they can be linked, not re-sent.
+
+    Entries are keyed by the asset's content hash, so editing an asset
+    uploads it again. Expired signed urls are refreshed through discord
+    before falling back to a new upload.
+    """
+
+    def __init__(self, bot: "Bot", conn: aiosqlite.Connection):
+        self.bot = bot
+        self.conn = conn
+        self.bytes_uploaded = 0
+
+    async def setup(self):
+        await self.conn.executescript(SCHEMA_UPLOADS)
+        await self.conn.commit()
+
+    async def refresh_url(self, url: str) -> Optional[str]:
+        route = Route("POST", "/attachments/refresh-urls")
+        try:
+            data = await self.bot.http.request(route, json={"attachment_urls": [url]})
+        except discord.HTTPException as e:
+            log.info("Could not refresh %s: %s", url, e)
+            return None
+        refreshed = data.get("refreshed_urls") or ()
+        for r in refreshed:
+            if r.get("original") == url:
+                return r.get("refreshed")
+        return None
+
+    async def get_url(self, name: str) -> Optional[str]:
+        """Get a working url of an earlier upload of the asset, if any."""
+        sha256 = asset_hash(name)
+        async with self.conn.execute_fetchall(
+            "SELECT url FROM uploads WHERE sha256=:sha256", {"sha256": sha256}
+        ) as rows:
+            if not rows:
+                return None
+            url = rows[0][0]
+
+        expiry = url_expiry(url)
+        if expiry is None or expiry - time.time() > UPLOAD_EXPIRY_MARGIN:
+            return url
+        url = await self.refresh_url(url)
+        if url is None:
+            await self.conn.execute(
+                "DELETE FROM uploads WHERE sha256=:sha256", {"sha256": sha256}
+            )
+        else:
+            await self.store(sha256, name, url)
+        await self.conn.commit()
+        return url
+
+    async def store(self, sha256: str, name: str, url: str):
+        await self.conn.execute(
+            """
+            INSERT OR REPLACE INTO uploads (sha256, name, url)
+            VALUES (:sha256, :name, :url);
+            """,
+            {"sha256": sha256, "name": name, "url": url},
+        )
+
+    async def record(self, message: Message, names: Iterable[str]):
+        by_filename = {a.filename: a for a in message.attachments}
+        for name in names:
+            attachment = by_filename.get(name)
+            if attachment is None:
+                continue
+            self.bytes_uploaded += attachment.size
+            await self.store(asset_hash(name), name, attachment.url)
+        await self.conn.commit()
+
+    async def send(
+        self,
+        channel: Messageable,
+        names: Iterable[str] = (),
+        content: Optional[str] = None,
+        embed: Optional[Embed] = None,
+        embed_image: Optional[str] = None,
+    ) -> Message:
+        """Send assets in a single message, linking the ones already uploaded.
+
+        embed_image is an asset shown as the image of the embed.
+        """
+        urls = []
+        upload = []
+        for name in names:
+            url = await self.get_url(name)
+            if url is None:
+                upload.append(name)
+            else:
+                urls.append(url)
+        reused = len(urls)
+        if embed_image is not None:
+            url = await self.get_url(embed_image)
+            if url is None:
+                upload.append(embed_image)
+                url = f"attachment://{embed_image}"
+            else:
+                reused += 1
+            embed.set_image(url=url)
+
+        files = []
+        for name in upload:
+            with get_asset(name) as path:
+                files.append(discord.File(path, filename=name))
+        lines = [content, *urls] if content else urls
+        message = await channel.send("\n".join(lines) or None, embed=embed, files=files)
+        await self.record(message, upload)
+        log.info("Uploaded %d assets, reused %d", len(upload), reused)
+        return message
@@ -1,10 +1,30 @@
+import asyncio
 import importlib.resources
+import subprocess
 from pathlib import Path
 from typing import ContextManager
 
+from cmpcstatus.constants import SUBPROCESS_TIMEOUT
+
 
 def get_asset(asset: str) -> ContextManager[Path]:
     files = importlib.resources.files(__package__)
     traversable = files.joinpath("assets/").joinpath(asset)
     as_file = importlib.resources.as_file(traversable)
     return as_file
+
+
+async def run_command(*args: str, timeout: float = SUBPROCESS_TIMEOUT) -> str:
+    """Run a program without blocking the event loop and return its stdout."""
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return stdout.decode()
@@ -0,0 +1,142 @@
+"""Finds out what blocks the event loop.
+
+The loop runs a heartbeat callback every `interval` seconds and a thread
+checks that it keeps running. While the heartbeat is late by more than
+`threshold`, the thread samples the stack of the loop's thread, and once
+the loop is free again the most common stack is recorded against the task
+that was running.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import FrameType
+from typing import Optional
+
+from cmpcstatus.constants import (
+    WATCHDOG_INTERVAL,
+    WATCHDOG_OFFENDERS,
+    WATCHDOG_STACK_DEPTH,
+    WATCHDOG_THRESHOLD,
+)
+
+log = logging.getLogger(__name__)
+
+# (file, line, qualified function name), innermost last
+Stack = tuple[tuple[str, int, str], ...]
+
+
+def sample_stack(frame: Optional[FrameType], depth: int) -> Stack:
+    stack = []
+    while frame is not None and len(stack) < depth:
+        code = frame.f_code
+        stack.append((code.co_filename, frame.f_lineno, code.co_qualname))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+@dataclass
+class Offender:
+    task: str
+    stack: Stack
+    blocks: int = 0
+    total: float = 0.0
+    worst: float = 0.0
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        threshold: float = WATCHDOG_THRESHOLD,
+        interval: float = WATCHDOG_INTERVAL,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        # written by the loop, read by the thread
+        self.last_beat = 0.0
+        # lag of the last late heartbeat, i.e. how long the last block took
+        self.block_lag = 0.0
+        self.beats = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.offenders: dict[tuple[str, Stack], Offender] = {}
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.loop.call_soon(self.heartbeat, self.last_beat)
+        self.thread = threading.Thread(target=self.watch, name="watchdog", daemon=True)
+        self.thread.start()
+        log.info("Watching the event loop, threshold %.0f ms", self.threshold * 1000)
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def heartbeat(self, expected: float):
+        now = time.monotonic()
+        lag = max(0.0, now - expected)
+        if lag > self.threshold:
+            self.block_lag = lag
+        self.beats += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_beat = now
+        if not self.stopping.is_set():
+            self.loop.call_later(self.interval, self.heartbeat, now + self.interval)
+
+    def watch(self):
+        samples: Counter[tuple[str, Stack]] = Counter()
+        blocked_beat = None
+        while not self.stopping.wait(self.interval):
+            beat = self.last_beat
+            late = time.monotonic() - beat - self.interval
+            if late > self.threshold:
+                frame = sys._current_frames().get(self.loop_thread)
+                task = asyncio.current_task(self.loop)
+                name = task.get_name() if task is not None else "callback"
+                samples[name, sample_stack(frame, WATCHDOG_STACK_DEPTH)] += 1
+                blocked_beat = beat
+            elif blocked_beat is not None and beat != blocked_beat:
+                self.record(samples.most_common(1)[0][0], self.block_lag)
+                samples.clear()
+                blocked_beat = None
+
+    def record(self, key: tuple[str, Stack], duration: float):
+        task, stack = key
+        log.warning(
+            "Event loop blocked for %.0f ms by %s",
+            duration * 1000,
+            task,
+            extra={"blocked_stack": [f"{f}:{n} {q}" for f, n, q in stack[-5:]]},
+        )
+        with self.lock:
+            offender = self.offenders.get(key)
+            if offender is None:
+                if len(self.offenders) >= WATCHDOG_OFFENDERS:
+                    least = min(self.offenders, key=lambda k: self.offenders[k].total)
+                    del self.offenders[least]
+                offender = self.offenders[key] = Offender(task, stack)
+            offender.blocks += 1
+            offender.total += duration
+            offender.worst = max(offender.worst, duration)
+
+    def worst(self, n: int) -> list[Offender]:
+        with self.lock:
+            offenders = list(self.offenders.values())
+        return sorted(offenders, key=lambda o: o.worst, reverse=True)[:n]
+
+    @property
+    def mean_lag(self) -> float:
+        return self.total_lag / self.beats if self.beats else 0.0
@@ -0,0 +1,33 @@
+"""Stand-ins for the bits of discord.py the tests touch."""
+
+import discord
+
+
+class FakeRole:
+    id = 1
+
+
+class FakeGuild:
+    default_role = FakeRole()
+
+
+class FakeChannel:
+    """Keeps its state like discord.py's cache does and counts the edits."""
+
+    id = 1
+
+    def __init__(self, name="fish-gaming-wednesday", topic=None):
+        self.guild = FakeGuild()
+        self.name = name
+        self.topic = topic
+        self.overwrites = {}
+        self.edits = []
+
+    def overwrites_for(self, role):
+        return self.overwrites.get(role, discord.PermissionOverwrite())
+
+    async def edit(self, *, reason, **changes):
+        self.edits.append(changes)
+        self.name = changes.get("name", self.name)
+        self.topic = changes.get("topic", self.topic)
+        self.overwrites = changes.get("overwrites", self.overwrites)
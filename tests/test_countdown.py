@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+from pathlib import Path
+
+import pytest
+from discord import Embed
+
+from cmpcstatus.cogs.events import engine as events_engine
+from cmpcstatus.cogs.events.engine import COUNTDOWN_MINUTE, EventEngine
+from cmpcstatus.constants import COUNTDOWN_MINUTES, TZ_AMSTERDAM
+
+EVENTS = Path(__file__).parent.parent / "events.toml"
+# the 5th of june 2024 was a wednesday, so fgw and the birthday lock together
+MIDNIGHT = datetime.datetime(2024, 6, 6, tzinfo=TZ_AMSTERDAM)
+DEADLINE = MIDNIGHT.timestamp() + COUNTDOWN_MINUTES * COUNTDOWN_MINUTE
+
+
+async def settle():
+    # let every task that can run get to its next sleep
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+class FakeClock:
+    """time.time and asyncio.sleep for the countdown, advanced by hand."""
+
+    def __init__(self, now: float):
+        self.now = now
+        self.sleepers = []
+        self.order = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        future = asyncio.get_running_loop().create_future()
+        wake = self.now + max(delay, 0)
+        heapq.heappush(self.sleepers, (wake, next(self.order), future))
+        await future
+
+    async def run_until(self, t: float):
+        await settle()
+        while self.sleepers and self.sleepers[0][0] <= t:
+            wake, _, future = heapq.heappop(self.sleepers)
+            self.now = wake
+            if not future.done():
+                future.set_result(None)
+            await settle()
+        self.now = t
+
+
+class FakeAsyncio:
+    def __init__(self, clock: FakeClock):
+        self.sleep = clock.sleep
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+
+class FakeMessage:
+    def __init__(self, clock: FakeClock, embed: Embed):
+        self.clock = clock
+        self.embeds = [embed]
+        # (seconds after midnight, countdown field or None once it's gone)
+        self.edits = []
+
+    async def edit(self, *, embed: Embed):
+        field = embed.fields[0].name if embed.fields else None
+        self.edits.append((self.clock.now - MIDNIGHT.timestamp(), field))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(MIDNIGHT.timestamp())
+    monkeypatch.setattr(events_engine, "time", clock)
+    monkeypatch.setattr(events_engine, "asyncio", FakeAsyncio(clock))
+    return clock
+
+
+@pytest.fixture
+def engine():
+    engine = EventEngine(None, path=str(EVENTS))
+    engine.load()
+    return engine
+
+
+def minutes(*left: int) -> list[str]:
+    return [
+        f"In {i} minute{'s' if i != 1 else ''} this channel will be hidden."
+        for i in left
+    ]
+
+
+@pytest.mark.asyncio
+async def test_overlapping_countdowns(clock, engine):
+    messages = {}
+    for name in ("Fish gaming wednesday", "Marcel's birthday"):
+        event = engine.events[name]
+        message = messages[name] = FakeMessage(clock, Embed(title=event.end_message))
+        engine.start_countdown(event, message, message.embeds[0], DEADLINE)
+
+    await clock.run_until(DEADLINE + 1)
+    for message in messages.values():
+        assert message.edits == [
+            *zip(range(0, 300, 60), minutes(5, 4, 3, 2, 1)),
+            (300, None),
+        ]
+    for task in engine.countdowns.values():
+        assert task.done()
+
+
+@pytest.mark.asyncio
+async def test_end_stops_its_own_countdown(clock, engine):
+    fgw = engine.events["Fish gaming wednesday"]
+    birthday = engine.events["Marcel's birthday"]
+    fgw_message = FakeMessage(clock, Embed(title=fgw.end_message))
+    birthday_message = FakeMessage(clock, Embed(title=birthday.end_message))
+    engine.start_countdown(fgw, fgw_message, fgw_message.embeds[0], DEADLINE)
+    engine.start_countdown(
+        birthday, birthday_message, birthday_message.embeds[0], DEADLINE
+    )
+
+    await clock.run_until(MIDNIGHT.timestamp() + 150)
+    await engine.stop_countdown(fgw.name)
+    assert fgw.name not in engine.countdowns
+    # the final message goes up as soon as it is stopped
+    assert fgw_message.edits[-1] == (150, None)
+
+    await clock.run_until(DEADLINE + 1)
+    assert [t for t, _ in fgw_message.edits] == [0, 60, 120, 150]
+    assert [t for t, _ in birthday_message.edits] == [0, 60, 120, 180, 240, 300]
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_missed_minutes(clock, engine):
+    # the bot restarted two minutes into the countdown
+    fgw = engine.events["Fish gaming wednesday"]
+    embed = Embed(title=fgw.end_message)
+    embed.add_field(name=minutes(3)[0], value="** **")
+    message = FakeMessage(clock, embed)
+    clock.now = MIDNIGHT.timestamp() + 130
+    engine.start_countdown(fgw, message, embed, DEADLINE)
+
+    await clock.run_until(DEADLINE + 1)
+    assert message.edits == [
+        (130, minutes(3)[0]),
+        (180, minutes(2)[0]),
+        (240, minutes(1)[0]),
+        (300, None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_resume_after_deadline_only_cleans_up(clock, engine):
+    fgw = engine.events["Fish gaming wednesday"]
+    message = FakeMessage(clock, Embed(title=fgw.end_message))
+    clock.now = DEADLINE + 30
+    engine.start_countdown(fgw, message, message.embeds[0], DEADLINE)
+
+    await clock.run_until(DEADLINE + 60)
+    assert message.edits == [(330, None)]
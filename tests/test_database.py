@@ -0,0 +1,29 @@
+import pytest
+
+from cmpcstatus.database import connect, get_state
+
+
+@pytest.mark.asyncio
+async def test_old_words_are_normalized_once(tmp_path):
+    path = tmp_path / "db.sqlite3"
+    conn = await connect(path)
+    # rows stored before normalization, as they were written
+    rows = [(1, "fuck!"), (2, "sh1t"), (3, "fuck"), (4, ":3")]
+    await conn.executemany("INSERT INTO lb VALUES (?, 0, 1, ?, 0, 1)", rows)
+    await conn.execute("DELETE FROM state")
+    await conn.commit()
+    await conn.close()
+
+    conn = await connect(path)
+    async with conn.execute_fetchall("SELECT word FROM lb ORDER BY message_id") as rows:
+        assert [r[0] for r in rows] == ["fuck", "shit", "fuck", ":3"]
+    assert await get_state(conn, "lb:normalized") is not None
+
+    # later rows are never touched again
+    await conn.execute("INSERT INTO lb VALUES (5, 0, 1, 'sh1t', 0, 1)")
+    await conn.commit()
+    await conn.close()
+    conn = await connect(path)
+    async with conn.execute_fetchall("SELECT word FROM lb WHERE message_id=5") as rows:
+        assert rows[0][0] == "sh1t"
+    await conn.close()
@@ -0,0 +1,177 @@
+import datetime
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from fakes import FakeChannel
+
+from cmpcstatus.cogs.events._definition import load_events
+from cmpcstatus.cogs.events.engine import EventEngine
+from cmpcstatus.constants import TZ_AMSTERDAM
+from cmpcstatus.database import connect
+
+EVENTS = Path(__file__).parent.parent / "events.toml"
+
+
+@pytest.fixture
+def events_path(tmp_path):
+    path = tmp_path / "events.toml"
+    shutil.copy(EVENTS, path)
+    return path
+
+
+def test_load_shipped_events():
+    events = load_events(str(EVENTS))
+    assert set(events) == {"Fish gaming wednesday", "Marcel's birthday"}
+    fgw = events["Fish gaming wednesday"]
+    assert fgw.get_phase("end").time == datetime.time(0, 5)
+
+
+@pytest.mark.parametrize(
+    "old, new, error",
+    [
+        ("time = 00:05:00", 'time = "00:05"', TypeError),
+        ('end_asset = "fgwends.png"', 'end_asset = "nope.png"', ValueError),
+        ('assets = ["fgw.mp4"]', 'assets = ["fgw.webm"]', ValueError),
+        ('permissions = "locked"', 'permissions = "closed"', ValueError),
+        ("weekday = 3", 'weekday = "3"', TypeError),
+        ('channel_name = "fish-gaming-wednesday"', "", KeyError),
+    ],
+)
+def test_invalid_events(events_path, old, new, error):
+    events_path.write_text(events_path.read_text().replace(old, new, 1))
+    with pytest.raises(error):
+        load_events(str(events_path))
+
+
+def test_bad_reload_keeps_old_events(events_path):
+    engine = EventEngine(None, path=str(events_path))
+    engine.load()
+    events, schedule = engine.events, engine.schedule
+    assert schedule
+
+    events_path.write_text(
+        events_path.read_text().replace("time = 00:05:00", 'time = "00:05"', 1)
+    )
+    engine.mtime = None
+    engine.maybe_reload()
+    assert engine.events is events
+    assert engine.schedule is schedule
+    # the broken file isn't retried until it changes again
+    assert engine.mtime is not None
+
+
+WEEKLY = """
+[[events]]
+name = "weekly"
+channel = 1
+channel_name = "weekly"
+channel_topic = "once a week"
+weekday = {weekday}
+mention = "@everyone"
+end_message = "weekly has ended."
+end_asset = "fgwends.png"
+
+[[events.start_messages]]
+content = "{{mention}}"
+assets = ["fgw.mp4"]
+
+[[events.start_messages]]
+content = "second message"
+
+[[events.phases]]
+kind = "start"
+time = 00:00:00
+permissions = "open"
+
+[[events.phases]]
+kind = "lock"
+days_after = 6
+time = 00:00:00
+permissions = "locked"
+
+[[events.phases]]
+kind = "end"
+days_after = 6
+time = 00:05:00
+permissions = "hidden"
+"""
+
+
+class FakeMessage:
+    id = 1
+
+    async def edit(self, **kwargs):
+        pass
+
+
+class FakeUploads:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, channel, names=(), content=None, **kwargs):
+        self.sent.append(content)
+        return FakeMessage()
+
+
+@pytest_asyncio.fixture
+async def weekly(tmp_path):
+    """An engine whose one event started today, so it should be open now."""
+    path = tmp_path / "events.toml"
+    today = datetime.datetime.now(TZ_AMSTERDAM).isoweekday()
+    path.write_text(WEEKLY.format(weekday=today))
+    channel = FakeChannel(name="weekly")
+    bot = SimpleNamespace(
+        get_channel=lambda channel_id: channel,
+        shard_ids=None,
+        uploads=FakeUploads(),
+        db=await connect(":memory:"),
+    )
+    engine = EventEngine(bot, path=str(path))
+    engine.load()
+    yield engine
+    await engine.cog_unload()
+    await bot.db.close()
+
+
+@pytest.mark.asyncio
+async def test_reconcile_without_state_only_syncs_the_channel(weekly):
+    await weekly.reconcile()
+    channel = weekly.bot.get_channel(1)
+    assert [set(e) for e in channel.edits] == [{"topic", "overwrites"}]
+    assert weekly.bot.uploads.sent == []
+    event = weekly.events["weekly"]
+    assert (await weekly.load_state(event))["phase"] == "start"
+
+
+@pytest.mark.asyncio
+async def test_caught_up_phase_isnt_run_again(weekly):
+    event = weekly.events["weekly"]
+    start = event.get_phase("start")
+    today = event.previous_phase(start, datetime.datetime.now(TZ_AMSTERDAM))
+    last_week = today - datetime.timedelta(days=1)
+    await weekly.save_state(event, "end", last_week)
+
+    # the start was missed while the bot was down
+    reconciled = await weekly.reconcile()
+    assert weekly.bot.uploads.sent == ["@everyone", "second message"]
+
+    weekly.rebuild_schedule(reconciled)
+    assert all(when > reconciled for when, _, _ in weekly.schedule)
+    # and if it was scheduled before reconciling it still only runs once
+    await weekly.run_phases([(event, "start", today)])
+    assert weekly.bot.uploads.sent == ["@everyone", "second message"]
+
+
+@pytest.mark.asyncio
+async def test_phases_due_at_the_same_moment_both_run(weekly):
+    # like in testing mode, where one day's lock is the next day's start
+    event = weekly.events["weekly"]
+    when = event.previous_phase(
+        event.get_phase("start"), datetime.datetime.now(TZ_AMSTERDAM)
+    )
+    await weekly.run_phases([(event, "lock", when), (event, "start", when)])
+    assert weekly.bot.uploads.sent == [None, "@everyone", "second message"]
+    assert (await weekly.load_state(event))["phase"] == "start"
@@ -0,0 +1,57 @@
+import pytest
+
+from cmpcstatus.members import MemberCache
+
+
+class FakeMember:
+    def __init__(self, guild, member_id):
+        self.guild = guild
+        self.id = member_id
+
+
+class FakeGuild:
+    def __init__(self, member_ids, cached=(), chunked=False):
+        self.id = 1
+        self.member_ids = set(member_ids)
+        self.cached = {i: FakeMember(self, i) for i in cached}
+        self.chunked = chunked
+        self.queries = []
+
+    def get_member(self, member_id):
+        return self.cached.get(member_id)
+
+    async def query_members(self, user_ids, limit, cache):
+        self.queries.append(list(user_ids))
+        return [FakeMember(self, i) for i in user_ids if i in self.member_ids]
+
+
+@pytest.mark.asyncio
+async def test_resolve_batches_and_remembers():
+    guild = FakeGuild(range(0, 300, 2))
+    cache = MemberCache()
+    found = await cache.resolve(guild, range(250))
+    assert sorted(found) == list(range(0, 250, 2))
+    assert [len(q) for q in guild.queries] == [100, 100, 50]
+
+    # members and non-members are both known now
+    found = await cache.resolve(guild, range(250))
+    assert sorted(found) == list(range(0, 250, 2))
+    assert len(guild.queries) == 3
+
+
+@pytest.mark.asyncio
+async def test_resolve_chunked_guild_skips_gateway():
+    guild = FakeGuild(range(10), cached=range(10), chunked=True)
+    found = await MemberCache().resolve(guild, range(20))
+    assert sorted(found) == list(range(10))
+    assert guild.queries == []
+
+
+@pytest.mark.asyncio
+async def test_left_members_are_not_queried():
+    guild = FakeGuild(range(10))
+    cache = MemberCache()
+    cache.left(guild.id, 3)
+    found = await cache.resolve(guild, [3])
+    assert found == {}
+    assert guild.queries == []
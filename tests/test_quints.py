@@ -0,0 +1,66 @@
+import random
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+
+from cmpcstatus.cogs import quints_etc
+from cmpcstatus.cogs.quints_etc import SCHEMA_QUINTS, Quints, QuintsLedger
+
+rng = random.Random(0)
+IDS = [
+    0,
+    7,
+    10,
+    100,
+    1_000_000,
+    1155555,
+    1200000,
+    2**63 - 1,
+    1234567890123455555,
+    1234567890000000000,
+    *(rng.randrange(2**63) for _ in range(1000)),
+]
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_consecutive_digits_many(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(quints_etc, "np", None)
+    expected = [Quints.consecutive_digits(i) for i in IDS]
+    assert quints_etc.consecutive_digits_many(IDS) == expected
+
+
+@pytest_asyncio.fixture
+async def ledger():
+    async with aiosqlite.connect(":memory:") as conn:
+        await conn.executescript(SCHEMA_QUINTS)
+        yield QuintsLedger(conn)
+
+
+async def count(conn) -> int:
+    async with conn.execute_fetchall("SELECT COUNT(*) FROM quints") as rows:
+        return rows[0][0]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_the_rows(ledger):
+    await ledger.add([(1, 1, 1, 1, 5), (2, 1, 1, 1, 6)])
+    real_commit = ledger.conn.commit
+
+    async def locked():
+        raise aiosqlite.OperationalError("database is locked")
+
+    ledger.conn.commit = locked
+    with pytest.raises(aiosqlite.OperationalError):
+        await ledger.flush()
+    # the timer's flush only logs
+    await ledger.try_flush()
+    await ledger.conn.rollback()
+    assert len(ledger.rows) == 2
+
+    ledger.conn.commit = real_commit
+    await ledger.add([(3, 1, 1, 1, 5)])
+    await ledger.flush()
+    assert await count(ledger.conn) == 3
+    assert ledger.rows == []
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from cmpcstatus.constants import SCAN_BATCH_SIZE, SCAN_QUEUE_BATCHES
+from cmpcstatus.scanner import HistoryConsumer, HistoryScanner
+
+
+class FakeChannel:
+    mention = "#history"
+
+    def __init__(self, n_messages: int):
+        self.n_messages = n_messages
+
+    async def history(self, limit=None, around=None):
+        for i in range(self.n_messages):
+            yield SimpleNamespace(id=i)
+            await asyncio.sleep(0)
+
+
+class Counter(HistoryConsumer):
+    name = "counter"
+
+    def __init__(self):
+        self.seen = 0
+
+    async def consume(self, messages):
+        self.seen += len(messages)
+
+
+class Broken(HistoryConsumer):
+    name = "broken"
+
+    async def consume(self, messages):
+        # let the producer fill the queue first
+        await asyncio.sleep(0.01)
+        raise RuntimeError("broken consumer")
+
+
+@pytest.mark.asyncio
+async def test_scan_feeds_every_consumer():
+    counters = [Counter(), Counter()]
+    progress = await HistoryScanner(counters).scan(FakeChannel(1234))
+    assert progress.done
+    assert progress.messages == 1234
+    assert [c.seen for c in counters] == [1234, 1234]
+
+
+@pytest.mark.asyncio
+async def test_failing_consumer_stops_the_producer():
+    # many more batches than fit in the queue
+    channel = FakeChannel(SCAN_BATCH_SIZE * (SCAN_QUEUE_BATCHES + 5))
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(HistoryScanner([Broken()]).scan(channel), 1)
+    others = asyncio.all_tasks() - {asyncio.current_task()}
+    assert not [t for t in others if "produce" in repr(t.get_coro())]
@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+from discord.ext import commands
+
+import cmpcstatus.bot
+from cmpcstatus import create_bot
+from cmpcstatus.bot import BotConfig
+from cmpcstatus.cogs import BotCog, Quints
+from cmpcstatus.constants import SHUTDOWN_TIMEOUT
+from cmpcstatus.database import connect
+
+MESSAGES = 500
+
+
+class SlowWriter(BotCog):
+    """Stands in for handlers that write to the database, like the profanity cog."""
+
+    async def cog_load(self):
+        await self.bot.db.execute("CREATE TABLE seen (message_id INTEGER)")
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        await asyncio.sleep(random.random() / 10)
+        await self.bot.db.execute("INSERT INTO seen VALUES (?)", (message.id,))
+        await self.bot.db.commit()
+
+
+def fake_message(i: int):
+    channel = SimpleNamespace(id=2, send=mock.AsyncMock())
+    return SimpleNamespace(
+        # five fives at the end make a quint
+        id=i * 1_000_000 + 155555,
+        content="hello",
+        guild=SimpleNamespace(id=1),
+        channel=channel,
+        author=SimpleNamespace(id=i, name=f"member{i}", bot=True),
+    )
+
+
+@pytest_asyncio.fixture
+async def bot(monkeypatch, tmp_path):
+    config = BotConfig("", "", "", "", "")
+    monkeypatch.setattr(cmpcstatus.bot, "load_config", lambda: config)
+    bot = create_bot()
+    # sets up the loop without logging in
+    async with bot:
+        bot.db = await connect(tmp_path / "db.sqlite3")
+        yield bot
+
+
+async def count(path, table: str) -> int:
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute_fetchall(f"SELECT COUNT(*) FROM {table}") as rows:
+            return rows[0][0]
+
+
+@pytest.mark.asyncio
+async def test_no_data_loss_under_load(bot, tmp_path):
+    path = tmp_path / "db.sqlite3"
+    await bot.add_cog(SlowWriter(bot))
+    await bot.add_cog(Quints(bot))
+
+    for i in range(MESSAGES):
+        bot.dispatch("message", fake_message(i))
+    # let the handlers start, then shut down in the middle of them
+    await asyncio.sleep(0.01)
+    closing = asyncio.create_task(bot.close())
+    await asyncio.sleep(0)
+    for i in range(MESSAGES, MESSAGES + 10):
+        bot.dispatch("message", fake_message(i))
+    await closing
+
+    assert await count(path, "seen") == MESSAGES
+    # quints are batched in memory and flushed when the cog is unloaded
+    assert await count(path, "quints") == MESSAGES
+    assert bot.dropped_events["message"] == 10
+
+
+@pytest.mark.asyncio
+async def test_close_again_waits_for_the_first(bot):
+    finished = []
+
+    async def shut_down():
+        await asyncio.sleep(0.1)
+        await bot.db.close()
+        finished.append(True)
+
+    with mock.patch.object(bot, "shut_down", shut_down):
+        first = asyncio.create_task(bot.close())
+        await asyncio.sleep(0)
+        await bot.close()
+        assert finished == [True]
+        await first
+    assert finished == [True]
+
+
+@pytest.mark.asyncio
+async def test_close_from_a_handler(bot, tmp_path):
+    await bot.add_cog(SlowWriter(bot))
+
+    async def on_exit(delay: float):
+        await asyncio.sleep(delay)
+        await bot.close()
+
+    # the exit command runs in a handler, which draining must not wait for,
+    # and neither may a second handler that closes while the first one drains
+    bot.add_listener(on_exit, "on_exit")
+    start = time.monotonic()
+    bot.dispatch("exit", 0)
+    bot.dispatch("exit", 0.05)
+    bot.dispatch("message", fake_message(0))
+    await asyncio.sleep(0.01)
+    assert bot.closing_task is not None
+    await bot.closing_task
+    assert time.monotonic() - start < SHUTDOWN_TIMEOUT / 2
+    assert await count(tmp_path / "db.sqlite3", "seen") == 1
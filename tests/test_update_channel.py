@@ -0,0 +1,70 @@
+import discord
+import pytest
+from fakes import FakeChannel
+
+from cmpcstatus.cogs.events.engine import EventEngine
+from cmpcstatus.constants import (
+    CHANNEL_PERMISSIONS_HIDDEN,
+    CHANNEL_PERMISSIONS_LOCKED,
+    CHANNEL_PERMISSIONS_OPEN,
+)
+
+update_channel = EventEngine.update_channel
+
+
+@pytest.mark.asyncio
+async def test_everything_changed_is_one_edit():
+    channel = FakeChannel(name="marcel-gaming-birthday", topic="old")
+    edited = await update_channel(
+        channel, CHANNEL_PERMISSIONS_OPEN, "start", "fish-gaming-wednesday", "new"
+    )
+    assert edited
+    assert len(channel.edits) == 1
+    assert set(channel.edits[0]) == {"name", "topic", "overwrites"}
+
+
+@pytest.mark.asyncio
+async def test_nothing_changed_is_no_edit():
+    channel = FakeChannel(topic="topic")
+    await update_channel(channel, CHANNEL_PERMISSIONS_OPEN, "start")
+    channel.edits.clear()
+
+    edited = await update_channel(
+        channel, CHANNEL_PERMISSIONS_OPEN, "start", "fish-gaming-wednesday", "topic"
+    )
+    assert not edited
+    assert channel.edits == []
+
+
+@pytest.mark.asyncio
+async def test_only_changed_fields_are_sent():
+    channel = FakeChannel(topic="topic")
+    await update_channel(channel, CHANNEL_PERMISSIONS_OPEN, "start")
+    channel.edits.clear()
+
+    await update_channel(
+        channel, CHANNEL_PERMISSIONS_LOCKED, "lock", "fish-gaming-wednesday", "topic"
+    )
+    assert [set(e) for e in channel.edits] == [{"overwrites"}]
+
+
+@pytest.mark.asyncio
+async def test_midnight_edits():
+    # fgw ends as the birthday starts in the same channel
+    channel = FakeChannel()
+    phases = [
+        (CHANNEL_PERMISSIONS_OPEN, "fish-gaming-wednesday", "fish"),
+        (CHANNEL_PERMISSIONS_LOCKED, None, None),
+        (CHANNEL_PERMISSIONS_HIDDEN, None, None),
+        (CHANNEL_PERMISSIONS_OPEN, "marcel-gaming-birthday", "birthday"),
+        # a restart reconciles to the phase the channel is already in
+        (CHANNEL_PERMISSIONS_OPEN, "marcel-gaming-birthday", "birthday"),
+    ]
+    for permissions, name, topic in phases:
+        await update_channel(channel, permissions, "test", name, topic)
+    assert len(channel.edits) == 4
+    assert channel.name == "marcel-gaming-birthday"
+    role = channel.guild.default_role
+    assert channel.overwrites_for(role) == discord.PermissionOverwrite(
+        **CHANNEL_PERMISSIONS_OPEN
+    )
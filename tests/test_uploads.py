@@ -0,0 +1,134 @@
+import itertools
+import time
+from types import SimpleNamespace
+
+import aiosqlite
+import discord
+import pytest
+import pytest_asyncio
+from discord import Embed
+
+from cmpcstatus.constants import UPLOAD_EXPIRY_MARGIN
+from cmpcstatus.uploads import UploadCache
+
+BIRTHDAY = ["press_1.png", "birthday.mp4", "press_1_vertical.png"]
+
+
+class FakeHTTP:
+    """Stands in for discord: counts uploaded bytes and signs attachment urls."""
+
+    def __init__(self):
+        self.bytes_uploaded = 0
+        self.messages = []
+        self.refreshes = 0
+        self.refresh_works = True
+        self.expiry = time.time() + 24 * 3600
+        self.ids = itertools.count(1)
+
+    def url(self, filename: str, expiry: float) -> str:
+        return (
+            f"https://cdn.discordapp.com/attachments/1/{next(self.ids)}/{filename}"
+            f"?ex={int(expiry):x}&is=0&hm=0"
+        )
+
+    async def send(self, content=None, *, embed=None, files=()):
+        attachments = []
+        for file in files:
+            size = len(file.fp.read())
+            self.bytes_uploaded += size
+            attachments.append(
+                SimpleNamespace(
+                    filename=file.filename,
+                    size=size,
+                    url=self.url(file.filename, self.expiry),
+                )
+            )
+            file.close()
+        message = SimpleNamespace(content=content, embed=embed, attachments=attachments)
+        self.messages.append(message)
+        return message
+
+    async def request(self, route, json):
+        self.refreshes += 1
+        if not self.refresh_works:
+            raise discord.HTTPException(
+                SimpleNamespace(status=400, reason="Bad Request"), "nope"
+            )
+        (url,) = json["attachment_urls"]
+        name = url.split("?")[0].rsplit("/", 1)[-1]
+        refreshed = self.url(name, time.time() + 24 * 3600)
+        return {"refreshed_urls": [{"original": url, "refreshed": refreshed}]}
+
+
+@pytest.fixture
+def http():
+    return FakeHTTP()
+
+
+@pytest_asyncio.fixture
+async def uploads(http):
+    async with aiosqlite.connect(":memory:") as conn:
+        uploads = UploadCache(SimpleNamespace(http=http), conn)
+        await uploads.setup()
+        yield uploads
+
+
+@pytest.mark.asyncio
+async def test_assets_are_uploaded_once(http, uploads):
+    await uploads.send(http, BIRTHDAY, content="birthday")
+    first = http.bytes_uploaded
+    assert first > 0
+    assert uploads.bytes_uploaded == first
+    # all three in one message
+    assert len(http.messages) == 1
+
+    await uploads.send(http, BIRTHDAY, content="birthday")
+    assert http.bytes_uploaded == first
+    lines = http.messages[-1].content.split("\n")
+    assert lines[0] == "birthday"
+    assert [u.split("?")[0].rsplit("/", 1)[-1] for u in lines[1:]] == BIRTHDAY
+
+
+@pytest.mark.asyncio
+async def test_embed_image_is_reused(http, uploads):
+    await uploads.send(http, embed=Embed(), embed_image="fgwends.png")
+    first = http.bytes_uploaded
+    embed = Embed()
+    await uploads.send(http, embed=embed, embed_image="fgwends.png")
+    assert http.bytes_uploaded == first
+    assert embed.image.url.startswith("https://cdn.discordapp.com/")
+
+
+@pytest.mark.asyncio
+async def test_only_new_assets_are_uploaded(http, uploads):
+    await uploads.send(http, ["fgw.mp4"])
+    fgw = http.bytes_uploaded
+    await uploads.send(http, ["fgw.mp4", "mgb.mp4"])
+    mgb = http.bytes_uploaded - fgw
+    assert 0 < mgb
+    assert [a.filename for a in http.messages[-1].attachments] == ["mgb.mp4"]
+
+
+@pytest.mark.asyncio
+async def test_expiring_urls_are_refreshed(http, uploads):
+    http.expiry = time.time() + UPLOAD_EXPIRY_MARGIN / 2
+    await uploads.send(http, ["fgw.mp4"])
+    first = http.bytes_uploaded
+
+    await uploads.send(http, ["fgw.mp4"])
+    assert http.refreshes == 1
+    assert http.bytes_uploaded == first
+    # the refreshed url is stored, so it isn't refreshed again
+    await uploads.send(http, ["fgw.mp4"])
+    assert http.refreshes == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_uploads_again(http, uploads):
+    http.expiry = time.time() + UPLOAD_EXPIRY_MARGIN / 2
+    await uploads.send(http, ["fgw.mp4"])
+    first = http.bytes_uploaded
+
+    http.refresh_works = False
+    await uploads.send(http, ["fgw.mp4"])
+    assert http.bytes_uploaded == 2 * first